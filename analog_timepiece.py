@@ -58,11 +58,13 @@ __license__ = "GPL v3.0 or more recent"
 # required imports for the AnalogTimepiece class
 import math
 import platform
+import time
 import pygame
 from pygame.locals import *
 import pygame.gfxdraw
 import settings as s
 import os.path
+from font_cache import font_cache
 
 class AnalogTimepiece():
     def __init__(
@@ -75,16 +77,18 @@ class AnalogTimepiece():
         railroad clock found in Germany.  The object has several methods to
         compute and draw the timepiece to a surface (parentdrawSurface).  The
         clock runs automatically based on system time. Internally, it
-        pre-renders the second hand movement onto a series of surfaces, then
-        draws or loads the background surface, hour and minute surface, and
-        second hand surface on to the parentdrawSurface.  The design is to
+        renders the second hand movement onto a series of surfaces, each the
+        first time it is shown or ahead of time with warm_up, then draws or
+        loads the background surface, hour and minute surface, and second
+        hand surface on to the parentdrawSurface.  The design is to
         reduce the size and number of blitting operations.  It is suitable to
         blit directly to a screen surface.
 
 
         parentdrawSurface: The surface to draw on, most likely the screen.
         parentdrawRect: The rectangle defined in reference to the parentdrawSurface in which to draw the clock.
-        fps: frames per second of the pygame loop.
+        fps: frames per second of the second hand animation, usually the frame
+        rate of the pygame loop. The loop may run slower.
         """
         if parentdrawRect.width != parentdrawRect.height:
             raise Exception(
@@ -113,12 +117,17 @@ class AnalogTimepiece():
         self.secondLayerRect = self.backgroundRect.copy()
         # Dictionary of surfaces for pre-rendering, Dictionary of Rects for
         # blitting placement they keys are SSFFF - 2 digits for minut (0 to
-        # 59), 3 digits for frame (0 to fps-1)
-        self.secondLayerSurfaceDict = {
-            00000: pygame.Surface(
-                self.backgroundRect.size,
-                flags=pygame.SRCALPHA)}
-        self.secondLayerRectDict = {00000: pygame.Rect(0, 0, 0, 0)}
+        # 59), 3 digits for frame (0 to fps-1). They fill as the sprites are
+        # rendered.
+        self.secondLayerSurfaceDict: dict[int, pygame.Surface] = {}
+        self.secondLayerRectDict: dict[int, pygame.Rect] = {}
+        # keys of all sprites, in the order they are shown
+        self.sprite_keys = [second * 1000 + frame for second in range(0, 60)
+                            for frame in range(0, self.fps)]
+        self.sprites_ready = False  # all sprites of sprite_keys are rendered
+        self.sprite_misses = 0  # sprites rendered when they were first shown
+        # Surface the second hand is drawn on before it is cut to its sprite
+        self.spriteCanvas = pygame.Surface(self.backgroundRect.size, flags=SRCALPHA)
         # Rect that defines where the changes have occured and should be blitted
         # with lcoal coordinates
         self.localBlitRect = self.backgroundRect.copy()
@@ -134,6 +143,9 @@ class AnalogTimepiece():
         self.finalBlitSourceSurfaceRects: list[pygame.Rect] = []
         # list of background rects covers the background of changed surface
         self.backgroundBlitRects: list[pygame.Rect] = []
+        # Rects in local coordinates that look different since the last blit.
+        # Unlike the blit lists they leave out the hands that did not move.
+        self.dirtyRects: list[pygame.Rect] = []
         """
         variables for clock design. These effectively operate like constants
         """
@@ -189,6 +201,11 @@ class AnalogTimepiece():
         self.frame_tracker = 0
         self.frame_second_index = 0
         self.previous_frame_second_index = 0
+        self.second_sprite_index = -1  # SSFFF index of the secondLayerSurface
+        # calculate the movement of the second hand between seconds
+        self.sub_second = self.ramp_tick(self.fps, self.SECOND_TICK_MODE)
+        self.blit_count = 0     # blits to the parent surface since creation
+        self.last_blit_count = 0  # blits of the last blit_changes call
 
     @staticmethod
     def circle_point(center, radius, theta):
@@ -501,6 +518,73 @@ class AnalogTimepiece():
                     ramp_list.append(1.0)
             return ramp_list
 
+    def render_second_sprite(self, second, frame):
+        """
+        Draws the second hand at a frame of a second and returns a Surface of
+        minimal size with per-pixel alpha and its Rect referenced to the
+        backgroundSurface.
+        """
+        self.spriteCanvas.fill((255, 255, 255, 0))
+        self.aa_second_hand2(self.spriteCanvas, second, self.sub_second[frame])
+        spriteRect = self.spriteCanvas.get_bounding_rect()
+        # create a Surface of minimal size
+        spriteSurface = pygame.Surface(spriteRect.size, flags=SRCALPHA)
+        spriteSurface.fill((255, 255, 255, 0))
+        spriteSurface.blit(self.spriteCanvas, (0, 0), area=spriteRect)
+        return spriteSurface, spriteRect
+
+    def store_second_sprite(self, key):
+        """ Renders the sprite of an SSFFF key into the dictionaries """
+        self.secondLayerSurfaceDict[key], self.secondLayerRectDict[key] = \
+            self.render_second_sprite(key // 1000, key % 1000)
+
+    def prerender_second_sprites(self):
+        """
+        Fills the dictionaries of second hand Surfaces and Rects, keyed SSFFF.
+        This is processor and memory intensive.
+        """
+        for key in self.sprite_keys:
+            if key not in self.secondLayerSurfaceDict:
+                self.store_second_sprite(key)
+        self.sprites_ready = True
+
+    def warm_up(self, budget_seconds):
+        """
+        Renders sprites that have not been shown yet, starting with the frames
+        after the current one, until budget_seconds have passed. The last
+        sprite may run over the budget. Returns True when all sprites are
+        rendered.
+        """
+        if self.sprites_ready is True:
+            return True
+        deadline = time.perf_counter() + budget_seconds
+        count = len(self.sprite_keys)
+        start = self.sprite_keys.index(self.frame_second_index)
+        for step in range(1, count + 1):
+            key = self.sprite_keys[(start + step) % count]
+            if key in self.secondLayerSurfaceDict:
+                continue
+            if time.perf_counter() >= deadline:
+                return False
+            self.store_second_sprite(key)
+        self.sprites_ready = True
+        return True
+
+    def second_sprite(self, index):
+        """
+        Returns the Surface and Rect of the second hand for an SSFFF index,
+        and renders the sprite if it is not rendered yet.
+        """
+        if index not in self.secondLayerSurfaceDict:
+            self.store_second_sprite(index)
+            self.sprite_misses += 1
+        return self.secondLayerSurfaceDict[index], self.secondLayerRectDict[index]
+
+    def sprite_bytes(self):
+        """ Returns the memory of the pixels of the second hand Surfaces """
+        return sum(surface.get_width() * surface.get_height() * surface.get_bytesize()
+                   for surface in self.secondLayerSurfaceDict.values())
+
 ##### Below are Methods intended to be called externally from game/program loop
 
     def compute_timepiece(self, now_var):
@@ -514,8 +598,7 @@ class AnalogTimepiece():
         self.now_var = now_var
         if self.first_run == 1:
             # This portion is only run once and builds the background imagery
-            # and creates the dictionary of second hand surfaces and reference
-            # rectangles Set background to black and all others to color key
+            # Set background to black and all others to color key
             # transparency
             self.backgroundSurface.fill(self.BLACK)
             self.firstLayerSurface.fill(self.COLOR_KEY)
@@ -600,11 +683,8 @@ class AnalogTimepiece():
                     FONTPATH = ""
             ### Calculate and prepare the date box.
             # calculate the maximum size of the date font box with the max character size.
-            if FONTPATH:
-                self.dateTextFont = pygame.font.Font(FONTPATH, 3 * self.CLOCK_R // 25)
-            else:
-                DEFAULT_FONT = pygame.font.get_default_font()
-                self.dateTextFont = pygame.font.SysFont(DEFAULT_FONT, 3 * self.CLOCK_R // 25)
+            # an empty FONTPATH is the default system font
+            self.dateTextFont = font_cache.get(FONTPATH, 3 * self.CLOCK_R // 25)
 
 
             dateBoxSurface = self.dateTextFont.render("88 . 88", 1, self.RED)
@@ -627,36 +707,9 @@ class AnalogTimepiece():
             self.finalBlitRects.append(self.backgroundRect)
             self.finalBlitSourceSurfaceRects.append(self.backgroundRect)
             self.finalBlitSurfaces.append(self.backgroundSurface)
-
-            # Pre-render the second hand Surfaces.
-            # This portion is processor and memory intensive
-            second = 0
-            frame = 0
-            # calculate the movement of the second hand between seconds
-            sub_second = self.ramp_tick(self.fps, self.SECOND_TICK_MODE)
-            # Create the temporary surfaces.  Theses are the only surface that has per-pixel alpha
-            tempSurface_1 = pygame.Surface(
-                self.backgroundRect.size, flags=SRCALPHA)
-            for second in range(0, 60):  # seconds
-                for frame in range(0, self.fps):  # frames in second
-                    tempSurface_1.fill((255, 255, 255, 0))
-                    # Draw the second hand on a normal size surface, get the
-                    # size
-                    self.aa_second_hand2(
-                        tempSurface_1, second, sub_second[frame])
-                    tempImageRect = tempSurface_1.get_bounding_rect()
-                    # create a Surface of minimal size
-                    tempSurface_2 = pygame.Surface(
-                        tempImageRect.size, flags=SRCALPHA)
-                    tempSurface_2.fill((255, 255, 255, 0))
-                    # TEMP
-                    # tempSurface_2.fill((0,250,0,128))
-                    tempSurface_2.blit(
-                        tempSurface_1, (0, 0),
-                        area=tempImageRect)
-                    temp_key = int(second * 1000 + frame)
-                    self.secondLayerSurfaceDict[temp_key] = tempSurface_2.copy()
-                    self.secondLayerRectDict[temp_key] = tempImageRect.copy()
+            self.dirtyRects.append(self.backgroundRect.copy())
+            # The second hand Surfaces are rendered when they are first shown
+            # or by warm_up.
             self.first_run = 0
             # End of first run code block
         # Continue with computations run on every loop
@@ -675,6 +728,7 @@ class AnalogTimepiece():
                 dateTextRect.centery = dateTextRect.centery + self.CLOCK_R // 66
                 self.backgroundSurface.blit(dateTextSurface, dateTextRect.topleft)
                 self.backgroundBlitRects.append(self.dateBoxRect)
+                self.dirtyRects.append(self.dateBoxRect.copy())
             # set copy Rects to previous minute Rect before they are changed
             self.previous_minute_Rect = self.current_minute_Rect.copy()
             self.previous_hour_Rect = self.current_hour_Rect.copy()
@@ -704,6 +758,8 @@ class AnalogTimepiece():
                 self.MINUTE_STROKE)
             # reassign the frame_minute to not redraw the minute and hour hands again.
             self.frame_minute = self.now_var.minute
+            self.dirtyRects.append(self.current_hour_Rect.union(self.previous_hour_Rect))
+            self.dirtyRects.append(self.current_minute_Rect.union(self.previous_minute_Rect))
         # NOTE: Currently blits hour and minute hands every frame.  Needs correction.
         # add rectangles and surfaces to blit lists for hours and minutes
         self.finalBlitRects.append(self.current_hour_Rect)
@@ -716,23 +772,22 @@ class AnalogTimepiece():
         self.finalBlitSurfaces.append(self.firstLayerSurface)
         self.backgroundBlitRects.append(self.current_minute_Rect.union(self.previous_minute_Rect))
 
-        # Apply the second hand from the dictionary of Surfaces and Rects
-        if self.current_second == self.now_var.second:
-            self.frame_tracker += 1
-            # safety to prevent going out of range if time and frame rates do
-            # not align
-            self.frame_tracker = min(self.frame_tracker, self.fps - 1)
-        else:
-            self.frame_tracker = 0
-            self.current_second = self.now_var.second
+        # Apply the second hand from the dictionary of Surfaces and Rects.
+        # The frame is selected from the fraction of the second, not by
+        # counting loops, so the hand is correct at any loop rate.
+        self.current_second = self.now_var.second
+        self.frame_tracker = min(self.now_var.microsecond * self.fps // 1000000, self.fps - 1)
         self.previous_frame_second_index = self.frame_second_index
         self.previous_second_Rect = self.secondLayerRect
         self.frame_second_index = int(
             self.current_second * 1000 + self.frame_tracker)
-        self.secondLayerSurface = self.secondLayerSurfaceDict[self.frame_second_index]
-        self.secondLayerRect = self.secondLayerRectDict[self.frame_second_index]
+        if self.second_sprite_index != self.frame_second_index:
+            self.secondLayerSurface, self.secondLayerRect = self.second_sprite(self.frame_second_index)
+            self.second_sprite_index = self.frame_second_index
         self.finalBlitRects.append(self.secondLayerRect)
         self.backgroundBlitRects.append(self.secondLayerRect.union(self.previous_second_Rect))
+        if self.frame_second_index != self.previous_frame_second_index:
+            self.dirtyRects.append(self.secondLayerRect.union(self.previous_second_Rect))
         # the arguments here are different thatn the other layers because the
         # dictionary of surfaces have different origin reference points and
         # sizes.
@@ -768,11 +823,9 @@ class AnalogTimepiece():
                 self.finalBlitSurfaces[count],
                 dest_rectangle, self.finalBlitSourceSurfaceRects[count])
             final_blit_dest_rects.append(blitted_rect)
-        # clear the lists of rectangles and surfaces.
-        self.finalBlitRects.clear()
-        self.finalBlitSourceSurfaceRects.clear()
-        self.finalBlitSurfaces.clear()
-        self.backgroundBlitRects.clear()
+        self.last_blit_count = len(self.finalBlitRects)
+        self.blit_count += self.last_blit_count
+        self.clear_changes()
         if return_type == 'none':
             return None
         elif return_type == 'rect':
@@ -782,6 +835,23 @@ class AnalogTimepiece():
         else:
             return True
 
+    def dirty_rects(self):
+        """
+        Returns the Rects of the parentdrawSurface where the timepiece changed
+        since the last blit_changes or clear_changes call. A compositor can
+        draw only these areas with blit_request instead of calling
+        blit_changes, which blits the hour and minute hands every frame.
+        """
+        return [self.re_reference_rect(self.parentdrawRect, rect) for rect in self.dirtyRects]
+
+    def clear_changes(self):
+        """ Clears the lists of changes that were blitted by the caller """
+        self.finalBlitRects.clear()
+        self.finalBlitSourceSurfaceRects.clear()
+        self.finalBlitSurfaces.clear()
+        self.backgroundBlitRects.clear()
+        self.dirtyRects.clear()
+
     def blit_request(self, re_rect: pygame.Rect):
         """
         Blits the current computed timepiece defined by the requested Rect.
@@ -803,6 +873,7 @@ class AnalogTimepiece():
         blit_source_rect = pygame.Rect((clipped_re_rect.x-self.secondLayerRect.x-self.parentdrawRect.x,\
                                         clipped_re_rect.y-self.secondLayerRect.y-self.parentdrawRect.y),clipped_re_rect.size)
         self.parentdrawSurface.blit(self.secondLayerSurface, clipped_re_rect, blit_source_rect)
+        self.blit_count += 3
 
 """
 End of AnalogTimepiece class definition
@@ -810,6 +881,79 @@ Code below is for testing and running from this file alone.
 """
 
 
+def channel_difference(first: pygame.Surface, second: pygame.Surface):
+    """ Returns a Surface of the absolute differences of the color channels
+    of two opaque Surfaces of the same size """
+    difference = first.copy()
+    difference.blit(second, (0, 0), special_flags=pygame.BLEND_RGB_SUB)
+    reverse = second.copy()
+    reverse.blit(first, (0, 0), special_flags=pygame.BLEND_RGB_SUB)
+    difference.blit(reverse, (0, 0), special_flags=pygame.BLEND_RGB_MAX)
+    return difference
+
+
+def pixels_over(difference: pygame.Surface, tolerance: int):
+    """ Counts the pixels of a channel_difference Surface with a channel
+    difference above tolerance """
+    within = pygame.mask.from_threshold(difference, (0, 0, 0), (tolerance + 1,) * 3 + (255,))
+    return difference.get_width() * difference.get_height() - within.count()
+
+
+def verify_second_sprites(size=700, fps=30, tolerance=0):
+    """
+    Compares the second hand sprites that warm_up stores, cut to their
+    bounding Rect, with the second hand drawn directly on a Surface of the
+    size of the clock, at every frame of the minute. Both are blitted on the
+    white of the clock face, as they are shown, and every color channel of
+    every pixel is compared. A sprite passes when no channel differs by more
+    than tolerance. Prints the largest difference, the failed frames and the
+    memory of the sprites. Returns True if all sprites pass.
+    """
+    timepiece = AnalogTimepiece(pygame.Surface((size, size)), pygame.Rect(0, 0, size, size), fps)
+    while timepiece.warm_up(1.0) is False:
+        pass
+    directSurface = pygame.Surface((size, size), flags=SRCALPHA)
+    largest = 0
+    failed = []
+    for second in range(0, 60):
+        for frame in range(0, fps):
+            spriteSurface, spriteRect = timepiece.second_sprite(second * 1000 + frame)
+            timepiece.aa_second_hand2(directSurface, second, timepiece.sub_second[frame])
+            spriteFace = pygame.Surface((size, size))
+            spriteFace.fill(timepiece.WHITE)
+            spriteFace.blit(spriteSurface, spriteRect)
+            directFace = pygame.Surface((size, size))
+            directFace.fill(timepiece.WHITE)
+            directFace.blit(directSurface, (0, 0))
+            # outside of both the faces are plain white
+            area = spriteRect.union(directSurface.get_bounding_rect())
+            difference = channel_difference(spriteFace.subsurface(area), directFace.subsurface(area))
+            over = pixels_over(difference, tolerance)
+            if over > 0:
+                failed.append((second, frame, over))
+            if pixels_over(difference, largest) == 0:
+                continue
+            # the largest channel difference by bisection of the tolerance
+            low, high = largest, 255
+            while low < high:
+                middle = (low + high) // 2
+                if pixels_over(difference, middle) == 0:
+                    high = middle
+                else:
+                    low = middle + 1
+            largest = low
+    print("sprites of a", size, "pixel clock at", fps, "fps:",
+          round(timepiece.sprite_bytes() / 2**20, 1), "MiB,",
+          timepiece.sprite_misses, "rendered when first shown")
+    print("largest color channel difference of the sprites:", largest, "tolerance:", tolerance)
+    if failed:
+        print(len(failed), "of", 60 * fps,
+              "sprites differ by more than the tolerance (second, frame, pixels):", failed[:10])
+    else:
+        print("all", 60 * fps, "sprites match the directly drawn second hand")
+    return not failed
+
+
 def main():
     """This is Executed only if file is run directly.  Intended for testing
     only. Some examples of what to import and define for implementation are
@@ -828,12 +972,13 @@ def main():
     atime = AnalogTimepiece(screen, screen_rect, FRAME_RATE)
     # variable that is assigned in the loop but should persist between loops.
     global now
-    print("\nStarting Analog Timepiece with a frame rate of", FRAME_RATE,
-          "\nStandby, background drawing will take some time.")
+    print("\nStarting Analog Timepiece with a frame rate of", FRAME_RATE)
     while not done:
         now = datetime.now()
         atime.compute_timepiece(now)
         blitted = atime.blit_changes('list')
+        # render the second hand ahead of time in part of the frame
+        atime.warm_up(0.25 / FRAME_RATE)
         # add some arbitrary rectangles to blit to test the blit_request method
         atime.blit_request(pygame.Rect((150,200),(350,50)))
         atime.blit_request(pygame.Rect((500,250),(50,350)))
@@ -857,6 +1002,14 @@ def main():
 
 if __name__ == "__main__":
     """ This is executed when run from the command line """
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(description="Displays the analog timepiece")
+    parser.add_argument('--verify-sprites', action='store', type=int, nargs='?', const=700, default=0, metavar='SIZE',
+                        help='Compare the second hand sprites of a clock of SIZE pixels with the directly drawn second hand and exit.')
+    args = parser.parse_args()
     clock = pygame.time.Clock()
     FRAME_RATE = 30
+    if args.verify_sprites:
+        sys.exit(0 if verify_second_sprites(args.verify_sprites, FRAME_RATE) else 1)
     main()
@@ -0,0 +1,300 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Benchmarks for the file catalog. Does not need real photos or pygame.
+
+USE:
+    ./benchmark_catalog.py --sizes 1000 10000 100000 --depths 1 4 --json results.json
+
+Builds synthetic image trees in a temporary directory and times
+catalog_files (without an index, with a new index and rescans with a warm
+index), tag_file, return_missing and the minute lookups. Results are printed
+as a table and optionally written as JSON so catalog changes can be compared.
+
+The trees contain a mix of valid names with small image headers, E-prefixed
+names, invalid names, zero-byte stub images and files that are not images.
+
+The minute lookups compare the minute slot index of FileCatalog2 with the
+previous linear hour_search of clock_main.py by looking up every minute of a
+full day the way the game loop does.
+"""
+
+import argparse
+import json
+import os
+import random
+import struct
+import tempfile
+import time
+import zlib
+
+from file_enumeration import FileCatalog2, FileRecord, MINUTES_PER_DAY
+
+
+def linear_hour_search(time4_f, image_file_list_f, start_index_f=0):
+    """
+    The linear search previously used by clock_main.py, kept as a reference.
+    This function when given a 4 digit integer time, a list coprising of
+    objects of class file_catalog_alt, and a start_index (0 is default) returns
+    a 2 element list of the stopping index and number matched at index
+    """
+    i = start_index_f
+    j = 0
+    len_f = len(image_file_list_f)
+    while i < len_f:
+        if i+1 == len_f and time4_f > image_file_list_f[i].clock4:
+        #if the next index will be out of range, then the next clock image msut be after midnight
+            return [0, 0]
+        elif i+1 == len_f and time4_f < image_file_list_f[i].clock4:
+        # if the next index will be out of range and the time is less than the current clock image, select the current index
+            return [i, 0]
+        elif time4_f == image_file_list_f[i].clock4:
+        # if there's a match of current time and current clock, check for how many
+        # total elements match by looping with iterate j
+            j = 1
+            while i+j+1 <= len_f:
+            # run a loop to check how many total elements match
+                if time4_f == image_file_list_f[i].clock4 \
+                and time4_f == image_file_list_f[i+j].clock4:
+                    j += 1
+                else:
+                    return [i,j] # return if all elements found. indexes preserved
+            return [i,j] # return if loop does not execute because the last index is being tested
+        elif time4_f > image_file_list_f[i].clock4 \
+        and time4_f >= image_file_list_f[i+1].clock4:
+        # iterate if current time is beyond current and next clock time
+            i += 1
+            j = 0
+
+        elif time4_f > image_file_list_f[i].clock4 \
+        and time4_f <= image_file_list_f[i+1].clock4:
+        # iterate if current time is beyond current clock but less or equal to next
+            i += 1
+            j = 0
+        elif time4_f < image_file_list_f[i].clock4 \
+        and time4_f < image_file_list_f[i+1].clock4:
+        # break out of loop if the next 2 clock times are greater than current
+            return [i, j]
+        else:
+        # return -1 to indicate error
+            return [-1, -1]
+    # If no condition matches, something is quite wrong, so raise an exception.
+    raise Exception("Time search matched no condition for input {}  Likely bug.".format(time4_f))
+#    return [i, j]  # is this ever used?
+
+
+def synthetic_catalog(records: int, coverage=0.8, seed=1):
+    """ Returns a FileCatalog2 filled with records for a random share of the
+    minutes of the day, several images for some minutes. No files are read. """
+    rng = random.Random(seed)
+    catalog = FileCatalog2("")
+    minutes = rng.sample(range(0, MINUTES_PER_DAY), int(MINUTES_PER_DAY * coverage))
+    for i in range(0, records):
+        minute = minutes[i % len(minutes)]
+        clock4 = (minute // 60) * 100 + minute % 60
+        catalog.image_file_list.append(FileRecord(clock4, "image%06d.jpg" % i, " synthetic"))
+    catalog.image_file_list.sort(key=lambda record: (record.clock4, record.image_filepath))
+    catalog.build_slot_index()
+    return catalog
+
+
+def day_of_minutes():
+    """ every 4 digit time of a day in order """
+    return [(minute // 60) * 100 + minute % 60 for minute in range(0, MINUTES_PER_DAY)]
+
+
+def time_linear_hour_search(catalog):
+    """ look up a full day like the game loop did, continuing from the
+    previous index and resetting at the end of the list. """
+    results = []
+    image_index = 0
+    start = time.perf_counter()
+    for time4 in day_of_minutes():
+        if image_index == len(catalog.image_file_list):
+            image_index = 0
+        result = linear_hour_search(time4, catalog.image_file_list, image_index)
+        image_index = result[0]
+        results.append(result)
+    return time.perf_counter() - start, results
+
+
+def time_minute_search(catalog):
+    """ look up a full day with the minute slot index """
+    results = []
+    start = time.perf_counter()
+    for time4 in day_of_minutes():
+        results.append(catalog.minute_search(time4))
+    return time.perf_counter() - start, results
+
+
+def compare_searches(catalog):
+    """ Returns rows of (method, seconds per day, microseconds per lookup) and
+    the number of matched minutes on which the two searches disagree. """
+    linear_seconds, linear_results = time_linear_hour_search(catalog)
+    slot_seconds, slot_results = time_minute_search(catalog)
+    mismatches = sum(1 for linear, slot in zip(linear_results, slot_results)
+                     if slot[1] > 0 and linear != slot)
+    rows = [("linear hour_search", linear_seconds, linear_seconds * 1e6 / MINUTES_PER_DAY),
+            ("minute slot index", slot_seconds, slot_seconds * 1e6 / MINUTES_PER_DAY)]
+    return rows, mismatches
+
+
+def png_header(width: int, height: int):
+    """ the first bytes of a PNG file, enough for the header check """
+    ihdr = b'IHDR' + struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + struct.pack('>I', 13) + ihdr + struct.pack('>I', zlib.crc32(ihdr))
+
+
+def jpeg_header(width: int, height: int):
+    """ a JPEG start of image and frame header, enough for the header check """
+    return b'\xff\xd8\xff\xc0' + struct.pack('>HBHHB', 11, 8, height, width, 3) + bytes(6) + b'\xff\xd9'
+
+
+def synthetic_name(rng, kind: str):
+    """ returns a file name of the given kind: valid, either, invalid or other """
+    hour, minute = rng.randrange(0, 12), rng.randrange(0, 60)
+    if kind == 'valid':
+        prefix = rng.choice('AP')
+        if prefix == 'P' and rng.random() < 0.5:
+            hour += 12  # PM clocks may use 24 hour notation
+        return '%s%02d%02d clock %d.%s' % (prefix, hour, minute, rng.randrange(1 << 30), rng.choice(['jpg', 'png']))
+    if kind == 'either':
+        return 'E%02d%02d either %d.jpg' % (hour + 1, minute, rng.randrange(1 << 30))
+    if kind == 'invalid':
+        return rng.choice(['A13%02d morning not afternoon %d.jpg',
+                           'P25%02d no such time %d.jpg',
+                           'holiday %02d %d.jpg',
+                           'apple%02d %d.png']) % (minute, rng.randrange(1 << 30))
+    return 'notes %d.txt' % rng.randrange(1 << 30)
+
+
+def generate_tree(root: str, files: int, depth: int, seed=1):
+    """
+    Writes a synthetic image tree with the given number of files below root,
+    spread over directories nested depth levels deep. About 70 percent valid
+    names, 10 percent E-prefixed, 10 percent invalid names, 5 percent zero-byte
+    stubs with valid names and 5 percent other files.
+    """
+    rng = random.Random(seed)
+    directories = [root]
+    for level in range(1, depth + 1):
+        for parent in list(directories):
+            if parent.count(os.sep) - root.count(os.sep) == level - 1:
+                for branch in range(0, 4):
+                    directories.append(os.path.join(parent, 'level%d_%d' % (level, branch)))
+    for directory in directories:
+        os.makedirs(directory, exist_ok=True)
+    for i in range(0, files):
+        roll = rng.random()
+        kind = 'valid' if roll < 0.75 else 'either' if roll < 0.85 else 'invalid' if roll < 0.95 else 'other'
+        name = synthetic_name(rng, kind)
+        with open(os.path.join(rng.choice(directories), name), 'wb') as f:
+            if kind == 'other':
+                f.write(b'not an image')
+            elif roll < 0.70 or kind != 'valid':
+                f.write(png_header(1080, 1080) if name.endswith('.png') else jpeg_header(4000, 3000))
+            # the remaining valid names are zero-byte stubs
+    return directories
+
+
+def time_call(function, *arguments):
+    """ returns the seconds taken by one call and the result """
+    start = time.perf_counter()
+    result = function(*arguments)
+    return time.perf_counter() - start, result
+
+
+def benchmark_tree(root: str, files: int, depth: int, workers: int):
+    """ runs all catalog benchmarks on one synthetic tree and returns a
+    dictionary of the results in seconds """
+    result = {'files': files, 'depth': depth}
+    result['generate'], directories = time_call(generate_tree, root, files, depth)
+    result['directories'] = len(directories)
+
+    catalog = FileCatalog2(root, '', True, workers)
+    result['catalog_files'], _ = time_call(catalog.catalog_files)
+    result['records'] = len(catalog.image_file_list)
+    result['errors'] = len(catalog.error_file_list)
+
+    index_filepath = os.path.join(root, 'benchmark-index.sqlite')
+    catalog = FileCatalog2(root, index_filepath, True, workers)
+    result['catalog_files_new_index'], _ = time_call(catalog.catalog_files)
+    catalog.clear_catalog_files()
+    result['rescan_warm_index'], _ = time_call(catalog.catalog_files)
+    # touch one percent of the files to force them to be parsed again
+    changed = [r.image_filepath for r in catalog.image_file_list[::100]]
+    for image_filepath in changed:
+        os.utime(image_filepath, ns=(0, time.time_ns()))
+    catalog.clear_catalog_files()
+    result['rescan_changed_1pct'], _ = time_call(catalog.catalog_files)
+
+    names = [r.image_filepath for r in catalog.image_file_list + catalog.error_file_list]
+    seconds, _ = time_call(lambda: [catalog.tag_file(name) for name in names])
+    result['tag_file_per_call'] = seconds / max(1, len(names))
+    result['build_slot_index'], _ = time_call(catalog.build_slot_index)
+    result['return_missing_all'], _ = time_call(catalog.return_missing, 24)
+    rows, mismatches = compare_searches(catalog)
+    result['hour_search_day'] = rows[0][1]
+    result['minute_search_day'] = rows[1][1]
+    result['search_mismatches'] = mismatches
+    return result
+
+
+# columns of the result table and their units
+TABLE_COLUMNS = [('files', 'files', '%d'), ('depth', 'depth', '%d'), ('records', 'records', '%d'),
+                 ('errors', 'errors', '%d'), ('catalog_files', 'scan s', '%.3f'),
+                 ('catalog_files_new_index', 'new idx s', '%.3f'), ('rescan_warm_index', 'warm s', '%.3f'),
+                 ('rescan_changed_1pct', '1% chg s', '%.3f'), ('tag_file_per_call', 'tag us', '%.2f'),
+                 ('return_missing_all', 'missing ms', '%.2f'), ('hour_search_day', 'linear ms', '%.2f'),
+                 ('minute_search_day', 'slots ms', '%.2f')]
+UNIT_SCALE = {'tag us': 1e6, 'missing ms': 1e3, 'linear ms': 1e3, 'slots ms': 1e3}
+
+
+def print_table(results):
+    print(' '.join('%10s' % heading for key, heading, form in TABLE_COLUMNS))
+    for result in results:
+        print(' '.join('%10s' % (form % (result[key] * UNIT_SCALE.get(heading, 1)))
+                       for key, heading, form in TABLE_COLUMNS))
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    parser = argparse.ArgumentParser(description="Benchmark the image clock file catalog on synthetic image trees.")
+    parser.add_argument('-s', '--sizes', action='store', type=int, nargs='+', default=[1000, 10000, 100000], help='Numbers of files per tree.')
+    parser.add_argument('-d', '--depths', action='store', type=int, nargs='+', default=[1, 4], help='Directory nesting depths.')
+    parser.add_argument('-t', '--threads', action='store', type=int, default=4, help='Scan threads for catalog_files.')
+    parser.add_argument('-j', '--json', action='store', default='', help='Write the results as JSON to this file, - for the console.')
+    parser.add_argument('--tmpdir', action='store', default=None, help='Directory for the synthetic trees, ideally on the storage to measure.')
+    args = parser.parse_args()
+    results = []
+    for files in args.sizes:
+        for depth in args.depths:
+            with tempfile.TemporaryDirectory(prefix='image-clock-bench-', dir=args.tmpdir) as root:
+                print("benchmarking %d files at depth %d in %s" % (files, depth, root))
+                results.append(benchmark_tree(root, files, depth, args.threads))
+    print()
+    print_table(results)
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
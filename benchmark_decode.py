@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Benchmarks the image decoders of image_loader.py on large JPEG files.
+
+USE:
+    ./benchmark_decode.py --megapixels 2 12 24 40 --target 1080 --json results.json
+
+Writes synthetic 4:3 JPEG photos of each size to a temporary directory and
+loads each one scaled to a square of the target size with every available
+decoder, the pygame loader and Pillow in draft mode if it is installed. Every
+load runs in a new python process, so the peak resident memory of the process
+is the memory that one decode needs. The results are the fastest of the
+repeats and the peak RSS above the RSS of the idle process.
+
+Linux and macOS only, the peak RSS is read from /proc or the resource module.
+"""
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# the display is not shown, but images are converted to its pixel format
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import pygame
+
+from image_loader import load_scaled_image, pillow_available
+
+
+def peak_rss_kb():
+    """ peak resident memory of this process in kilobytes """
+    # On Linux ru_maxrss survives exec, so a child would report the peak of
+    # the benchmark process. VmHWM belongs to the new address space.
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak // 1024  # bytes on macOS
+    return peak
+
+
+def decode_worker(decoder: str, image_filepath: str, target: int):
+    """ Loads one image in this process and returns the measurements """
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    idle_rss = peak_rss_kb()
+    start = time.perf_counter()
+    load_scaled_image(image_filepath, (target, target), decoder)
+    seconds = time.perf_counter() - start
+    return {'seconds': seconds, 'idle_rss_kb': idle_rss, 'peak_rss_kb': peak_rss_kb()}
+
+
+def write_jpeg(image_filepath: str, megapixels: float, seed=1):
+    """ Writes a 4:3 JPEG of about megapixels, scaled up from random blocks so
+    it is not trivial to compress. """
+    width = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    height = width * 3 // 4
+    rng = random.Random(seed)
+    blocks = pygame.Surface((64, 48))
+    for x in range(64):
+        for y in range(48):
+            blocks.set_at((x, y), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    pygame.image.save(pygame.transform.smoothscale(blocks, (width, height)), image_filepath)
+    return width, height
+
+
+def run_worker(decoder: str, image_filepath: str, target: int):
+    output = subprocess.run([sys.executable, os.path.abspath(__file__), '--worker', decoder,
+                             image_filepath, '--target', str(target)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def benchmark_image(image_filepath: str, megapixels: float, target: int, decoders: list, repeats: int):
+    width, height = write_jpeg(image_filepath, megapixels)
+    results = []
+    for decoder in decoders:
+        runs = [run_worker(decoder, image_filepath, target) for repeat in range(repeats)]
+        results.append({'megapixels': width * height / 1e6, 'width': width, 'height': height,
+                        'file_mb': os.path.getsize(image_filepath) / 1e6, 'decoder': decoder,
+                        'seconds': min(run['seconds'] for run in runs),
+                        'peak_rss_mb': max(run['peak_rss_kb'] for run in runs) / 1024,
+                        'decode_rss_mb': max(run['peak_rss_kb'] - run['idle_rss_kb'] for run in runs) / 1024})
+    return results
+
+
+# columns of the result table
+TABLE_COLUMNS = [('megapixels', 'MP', '%.1f'), ('file_mb', 'file MB', '%.1f'), ('decoder', 'decoder', '%s'),
+                 ('seconds', 'decode s', '%.3f'), ('peak_rss_mb', 'peak MB', '%.1f'),
+                 ('decode_rss_mb', 'decode MB', '%.1f')]
+
+
+def print_table(results):
+    print(' '.join('%10s' % heading for key, heading, form in TABLE_COLUMNS))
+    for result in results:
+        print(' '.join('%10s' % (form % result[key]) for key, heading, form in TABLE_COLUMNS))
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    parser = argparse.ArgumentParser(description="Benchmark the image clock image decoders on large JPEG files.")
+    parser.add_argument('-m', '--megapixels', action='store', type=float, nargs='+', default=[2, 12, 24, 40], help='Sizes of the test images in megapixels.')
+    parser.add_argument('-t', '--target', action='store', type=int, default=1080, help='Side of the square display size to scale to.')
+    parser.add_argument('-r', '--repeats', action='store', type=int, default=3, help='Loads per image and decoder.')
+    parser.add_argument('-j', '--json', action='store', default='', help='Write the results as JSON to this file, - for the console.')
+    parser.add_argument('--tmpdir', action='store', default=None, help='Directory for the test images.')
+    parser.add_argument('--worker', action='store', nargs=2, metavar=('DECODER', 'IMAGE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        print(json.dumps(decode_worker(args.worker[0], args.worker[1], args.target)))
+        sys.exit(0)
+    decoders = ['pygame']
+    if pillow_available():
+        decoders.append('pillow')
+    else:
+        print("Pillow is not installed, only the pygame loader is measured")
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    results = []
+    with tempfile.TemporaryDirectory(prefix='image-clock-bench-', dir=args.tmpdir) as root:
+        for megapixels in args.megapixels:
+            print("benchmarking a %g megapixel JPEG" % megapixels)
+            results.extend(benchmark_image(os.path.join(root, 'P1200 test.jpg'), megapixels,
+                                           args.target, decoders, args.repeats))
+    print()
+    print_table(results)
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
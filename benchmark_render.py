@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Benchmarks the rendering of clock_main.py in every display state without a
+display.
+
+USE:
+    ./benchmark_render.py --framerates 30 15 --json results.json
+
+Runs clock_main.py headless on a simulated clock with a synthetic image
+directory and --stats-json, and prints the frame statistics of each display
+state. The scenarios are:
+    image    - two minutes with an image: new minute, fading text, static image
+    analog   - two minutes without images: the analog clock with and without text
+    rollover - a minute per frame (--step 60) over hours where every third
+               minute has an image, to measure minute transitions
+The work time of a frame is the time spent drawing it. The processor time
+from getrusage and the frame rate include the wait for the next frame. The
+first frame of each run draws the analog clock and is reported as startup.
+
+Run it with the same settings and display size on the builds or frame rates
+to compare. The image-clock.ini of the runs is written to the temporary
+directory, so the local settings do not apply.
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from benchmark_decode import write_jpeg
+
+CLOCK_MAIN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'clock_main.py')
+IMAGE_START = 100   # the image scenario runs from 01:00
+ANALOG_START = 200  # the analog scenario runs from 02:00, which has no images
+
+
+def make_image_tree(root: str, rollover_minutes: int, megapixels: float):
+    """ Writes the image directory and the settings of the runs. Every third
+    minute of the rollover range has an image, and the two minutes of the
+    image scenario. """
+    image_dir = os.path.join(root, 'images')
+    os.makedirs(image_dir)
+    source = os.path.join(root, 'source.jpg')
+    write_jpeg(source, megapixels)
+    with open(source, 'rb') as f:
+        jpeg = f.read()
+    minutes = set(range(0, rollover_minutes, 3)) | {60 * (IMAGE_START // 100), 60 * (IMAGE_START // 100) + 1}
+    for minute in sorted(minutes):
+        if minute // 60 == ANALOG_START // 100:
+            continue
+        with open(os.path.join(image_dir, 'A%02d%02d benchmark.jpg' % (minute // 60, minute % 60)), 'wb') as f:
+            f.write(jpeg)
+    with open(os.path.join(root, 'image-clock.ini'), 'w') as f:
+        f.write("[CATALOG]\nwatch = False\n\n[IMAGE_CACHE]\npath = %s\n" % os.path.join(root, 'cache'))
+    return image_dir
+
+
+def run_clock(root: str, image_dir: str, framerate: int, clock_args: list):
+    """ Runs the clock headless and returns its statistics """
+    stats_filepath = os.path.join(root, 'stats.json')
+    subprocess.run([sys.executable, CLOCK_MAIN, '--headless', '--imagepath', image_dir,
+                    '--stats-json', stats_filepath, '-r', str(framerate)] + clock_args,
+                   cwd=root, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    with open(stats_filepath) as f:
+        return json.load(f)
+
+
+def scenarios(speed: float, rollover_minutes: int):
+    """ The scenario names and the clock arguments of each """
+    return [('image', ['--simulate', str(speed), '--start', '%04d' % IMAGE_START, '--duration', '2']),
+            ('analog', ['--simulate', str(speed), '--start', '%04d' % ANALOG_START, '--duration', '2']),
+            ('rollover', ['--step', '60', '--start', '0000', '--duration', str(rollover_minutes)])]
+
+
+def benchmark(root: str, framerates: list, speed: float, rollover_minutes: int, megapixels: float):
+    image_dir = make_image_tree(root, rollover_minutes, megapixels)
+    results = []
+    for framerate in framerates:
+        for scenario, clock_args in scenarios(speed, rollover_minutes):
+            print("running the %s scenario at %d fps" % (scenario, framerate))
+            stats = run_clock(root, image_dir, framerate, clock_args)
+            for state, state_stats in stats['states'].items():
+                result = {'framerate': framerate, 'scenario': scenario, 'state': int(state)}
+                result.update(state_stats)
+                results.append(result)
+    return results
+
+
+# columns of the result table
+TABLE_COLUMNS = [('framerate', 'rate', '%d'), ('scenario', 'scenario', '%s'), ('name', 'state', '%s'),
+                 ('frames', 'frames', '%d'), ('fps', 'fps', '%.1f'), ('work_p50_ms', 'p50 ms', '%.2f'),
+                 ('work_p95_ms', 'p95 ms', '%.2f'), ('work_p99_ms', 'p99 ms', '%.2f'),
+                 ('work_max_ms', 'max ms', '%.1f'), ('cpu_ms_per_frame', 'cpu ms/f', '%.2f'),
+                 ('cpu_percent', 'cpu %', '%.1f'), ('blits_per_frame', 'blits/f', '%.1f')]
+COLUMN_WIDTHS = {'state': 18}
+
+
+def print_table(results):
+    print(' '.join('%*s' % (COLUMN_WIDTHS.get(heading, 9), heading) for key, heading, form in TABLE_COLUMNS))
+    for result in results:
+        print(' '.join('%*s' % (COLUMN_WIDTHS.get(heading, 9), form % result[key])
+                       for key, heading, form in TABLE_COLUMNS))
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    parser = argparse.ArgumentParser(description="Benchmark the image clock rendering in every display state without a display.")
+    parser.add_argument('-r', '--framerates', action='store', type=int, nargs='+', default=[30], help='Frame rates (--framerate of the clock) to compare.')
+    parser.add_argument('-s', '--speed', action='store', type=float, default=4, help='Speed of the simulated clock in the image and analog scenarios.')
+    parser.add_argument('--rollover-minutes', action='store', type=int, default=240, help='Minutes replayed in the rollover scenario.')
+    parser.add_argument('-m', '--megapixels', action='store', type=float, default=2, help='Size of the test images in megapixels.')
+    parser.add_argument('-j', '--json', action='store', default='', help='Write the results as JSON to this file, - for the console.')
+    parser.add_argument('--tmpdir', action='store', default=None, help='Directory for the test images and cache.')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory(prefix='image-clock-bench-', dir=args.tmpdir) as root:
+        results = benchmark(root, args.framerates, args.speed, args.rollover_minutes, args.megapixels)
+    print()
+    print_table(results)
+    if args.json == '-':
+        print(json.dumps(results, indent=2))
+    elif args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
@@ -24,8 +24,6 @@ The original purpose is to display one photgraph of a clock per minute in a imag
 format that is square-cropped.
 
 TODO 18 Sep 2021
-* If possible, add some intro text when the analog clock is computing and there is
-  a blank screen. Previous attepts have been overwritten.
 * Move all settings to the settings file and set up file imports.
 * Complete the text_overlays module for different text overlay operations and options.
 * Some optimizations in the AnalogTimepiece that may improve computation speed.
@@ -37,10 +35,14 @@ TODO 18 Sep 2021
 
 ## import required python standard libraries
 import argparse
-from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+import json
 import math
+import multiprocessing
 import os
 import platform
+import queue
 import stat
 import sys
 import time
@@ -53,8 +55,20 @@ from pygame import Surface
 ## import additional project files
 import settings as s
 from analog_timepiece import AnalogTimepiece
-from file_enumeration import FileCatalog2
+from file_enumeration import FileCatalog2, INDEX_FILENAME
+from file_watcher import start_watcher
+from frame_governor import FrameRateGovernor
+from font_cache import font_cache, TextLabel
+from frame_hud import FrameHUD
+from frame_stats import FrameStats, duration_summary
+from scene_compositor import SceneCompositor, FillLayer, AnalogClockLayer, ImageLayer, LabelLayer
+from time_source import SystemTimeSource, SimulatedTimeSource
+from image_cache import ScaledImageCache, SurfaceCache
+from metrics_server import ClockMetrics, MetricsServer, catalog_snapshot
+from image_loader import ImageLoader, ImagePrefetcher, DECODERS, pillow_available, \
+     prescale_worker_init, prescale_image
 from signal_handler import SignalHandler
+from text_overlays import FadeText, FADE_CURVES
 
 ## define file paths based on platform.
 
@@ -62,6 +76,7 @@ from signal_handler import SignalHandler
 try:
     if platform.system() == 'Linux':
         IMAGE_PATH = "/var/lib/image-clock/images/"
+        IMAGE_CACHE_PATH = "/var/lib/image-clock/cache/"
         FONTPATH_TIME=FONTPATH_DATE=FONTPATH_NEXT=\
          "/var/lib/image-clock/fonts/Indulta/Indulta-SemiSerif-boldFFP.otf"
         if not os.path.exists(FONTPATH_TIME):
@@ -70,6 +85,7 @@ try:
 
     elif platform.system() == 'Windows':
         IMAGE_PATH = "C:/ProgramData/image-clock/images/"
+        IMAGE_CACHE_PATH = "C:/ProgramData/image-clock/cache/"
         FONTPATH_TIME=FONTPATH_DATE=FONTPATH_NEXT=\
         "C:/ProgramData/image-clock/fonts/Indulta/Indulta-SemiSerif-boldFFP.otf"
         if not os.path.exists(FONTPATH_TIME):
@@ -87,6 +103,16 @@ except:
 # TIME_FONT_PERCENT = 10 #height of time font as percent of display size
 # FADE_SECONDS = 20 # Number of seconds for font fading
 
+WINDOWED_SIZE = (850,720) # initial size of the window in windowed mode
+FPS_LOG_SECONDS = 60 # interval of the effective frame rate messages with --verbose
+IDLE_MAX_WAIT_MS = 1000 # longest idle wait. Signal handlers only run between waits
+CATALOG_EVENT = pygame.USEREVENT + 1 # posted by the watcher thread to wake an idle loop
+
+# Video drivers that block in SDL_WaitEventTimeout. SDL polls every millisecond
+# while waiting on the others, like kmsdrm on the Raspberry Pi console.
+NATIVE_WAIT_DRIVERS = ('x11', 'wayland', 'windows', 'cocoa')
+IDLE_SLEEP_MS = 100 # sleep slices of the idle wait on the other video drivers
+
 """ Set up argument parser for command line options """
 parser = argparse.ArgumentParser(description="The image clock displays the time using images stored in a default image directory. Part function, part form, it is designed to be run continuously.")
 parser.add_argument('-w','--windowed', action='store_true', help='Launch clock in windowed mode. (default action)')
@@ -96,10 +122,40 @@ parser.add_argument('-i','--invalidfiles', action='store_true', help='Print inva
 parser.add_argument('-r','--framerate', action='store', type=int, default=30, help='Set the frame rate with an integer instead of the program default of 30.')
 parser.add_argument('-l','--listfiles', action='store_true', help='List inputted files and exit. Do not execute graphical clock.')
 parser.add_argument('-m','--missing', action='store', type=int, default=-1, help='Display the  missing clocks. Takes an arguement 0-23 for the hour. Use 24 to search all hours.')
+parser.add_argument('-j','--json', action='store_true', help='With --missing, print the missing clocks as JSON.')
+parser.add_argument('--prescale', action='store', type=int, nargs='?', const=0, default=-1, metavar='SIZE', help='Scale all cataloged images into the scaled image cache and exit. Takes the side of the displayed square in pixels, default the size of the windowed or with -f the fullscreen display.')
+parser.add_argument('--headless', action='store_true', help='Run without a display using the SDL dummy video driver.')
+parser.add_argument('--simulate', action='store', type=float, default=0, metavar='SPEED', help='Run on a simulated clock SPEED times faster than real time.')
+parser.add_argument('--step', action='store', type=float, default=0, metavar='SECONDS', help='Run on a simulated clock that advances SECONDS every frame, as fast as possible. 60 replays a minute per frame.')
+parser.add_argument('--start', action='store', type=int, default=-1, metavar='HHMM', help='Start time of the simulated clock, default the current time.')
+parser.add_argument('--duration', action='store', type=int, default=0, metavar='MINUTES', help='Exit after this many minutes of clock time.')
+parser.add_argument('--imagepath', action='store', default='', metavar='DIR', help='Image directory instead of the default for the platform.')
+parser.add_argument('--hud', action='store_true', help='Start with the frame timing overlay shown. Press h to show or hide it.')
+parser.add_argument('--metrics', action='store_true', help='Serve render and catalog metrics in the Prometheus format. See [METRICS] in image-clock.ini for the address.')
+parser.add_argument('--stats-json', action='store', default='', metavar='FILE', help='Write frame time, processor time and blit statistics by display state as JSON to FILE at exit.')
 args = parser.parse_args()
 
+if args.imagepath:
+    IMAGE_PATH = args.imagepath
+
 s.FRAME_RATE = args.framerate # Assign frame rate to command line argument
 
+if args.headless is True:
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+# Set up the time source. Everything in the game loop reads the time of the
+# frame from it, so a simulated clock can replay a day in seconds.
+if args.simulate > 0 or args.step > 0 or args.start >= 0:
+    simulation_start = datetime.now().replace(second=0, microsecond=0)
+    if args.start >= 0:
+        if args.start // 100 > 23 or args.start % 100 > 59:
+            parser.error("--start must be a time HHMM from 0000 to 2359")
+        simulation_start = simulation_start.replace(hour=args.start // 100, minute=args.start % 100)
+    time_source = SimulatedTimeSource(simulation_start, args.simulate or 1.0, args.step)
+    print("Simulated clock from", simulation_start, "speed", args.simulate or 1.0, "step seconds", args.step)
+else:
+    time_source = SystemTimeSource()
+
 ## pygame needs inititiation for some functions to define
 pygame.init() # Initialize pygame
 pygame.mixer.quit() # Immediately disabling sound mixer to save processor
@@ -110,60 +166,89 @@ pygame.mixer.quit() # Immediately disabling sound mixer to save processor
 
 def time4():
     """
-    Outputs the current local time as a 4 digit integer format HHMM
+    Outputs the time of the current frame as a 4 digit integer format HHMM
     """
-    return int(datetime.now().hour*100) + int(datetime.now().minute)
-
-def hour_search(time4_f, image_file_list_f, start_index_f=0):
-    """
-    This function when given a 4 digit integer time, a list coprising of
-    objects of class file_catalog_alt, and a start_index (0 is default) returns
-    a 2 element list of the stopping index and number matched at index
-    """
-    i = start_index_f
-    j = 0
-    len_f = len(image_file_list_f)
-    while i < len_f:
-        if i+1 == len_f and time4_f > image_file_list_f[i].clock4:
-        #if the next index will be out of range, then the next clock image msut be after midnight
-            return [0, 0]
-        elif i+1 == len_f and time4_f < image_file_list_f[i].clock4:
-        # if the next index will be out of range and the time is less than the current clock image, select the current index
-            return [i, 0]
-        elif time4_f == image_file_list_f[i].clock4:
-        # if there's a match of current time and current clock, check for how many
-        # total elements match by looping with iterate j
-            j = 1
-            while i+j+1 <= len_f:
-            # run a loop to check how many total elements match
-                if time4_f == image_file_list_f[i].clock4 \
-                and time4_f == image_file_list_f[i+j].clock4:
-                    j += 1
-                else:
-                    return [i,j] # return if all elements found. indexes preserved
-            return [i,j] # return if loop does not execute because the last index is being tested
-        elif time4_f > image_file_list_f[i].clock4 \
-        and time4_f >= image_file_list_f[i+1].clock4:
-        # iterate if current time is beyond current and next clock time
-            i += 1
-            j = 0
-
-        elif time4_f > image_file_list_f[i].clock4 \
-        and time4_f <= image_file_list_f[i+1].clock4:
-        # iterate if current time is beyond current clock but less or equal to next
-            i += 1
-            j = 0
-        elif time4_f < image_file_list_f[i].clock4 \
-        and time4_f < image_file_list_f[i+1].clock4:
-        # break out of loop if the next 2 clock times are greater than current
-            return [i, j]
-        else:
-        # return -1 to indicate error
-            return [-1, -1]
-    # If no condition matches, something is quite wrong, so raise an exception.
-    raise Exception("Time search matched no condition for input {}  Likely bug.".format(time4_f))
-#    return [i, j]  # is this ever used?
-
+    return time_source.frame_time.hour*100 + time_source.frame_time.minute
+
+
+def select_image_index(image_index, matched_images, day):
+    """ Selects one of the matched images based on the day of the month when
+    more than one image matches the minute. The images take turns by day and
+    the selection stays within the matches of the minute. """
+    if matched_images > 1:
+        return image_index + (day - 1) % matched_images
+    return image_index
+
+def prescale_catalog(catalog, size, workers=None):
+    """ Scales every image of the catalog to size into the scaled image cache
+    with a process pool and reports the progress. """
+    cache_dir = s.IMAGE_CACHE_PATH or IMAGE_CACHE_PATH
+    budget_bytes = s.IMAGE_CACHE_SIZE_MB * 1024 * 1024
+    image_filepaths = sorted(set(obj.image_filepath for obj in catalog.image_file_list))
+    total = len(image_filepaths)
+    workers = workers or os.cpu_count() or 1
+    if 'fork' in multiprocessing.get_all_start_methods():
+        # workers must not import this script, so they are forked
+        context = multiprocessing.get_context('fork')
+    else:
+        context = None
+        workers = 1
+        print("Processes can not be forked on this platform. Prescaling in one process.")
+    print("Prescaling", total, "images to", size, "in", cache_dir, "with", workers, "processes")
+    results = {'scaled': 0, 'cached': 0, 'failed': 0}
+    start = time.perf_counter()
+    last_report = start
+    if context is None:
+        prescale_worker_init(cache_dir, budget_bytes, image_decoder)
+        outcomes = ((image_filepath, prescale_image(image_filepath, size)) for image_filepath in image_filepaths)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(workers, mp_context=context, initializer=prescale_worker_init,
+                                       initargs=(cache_dir, budget_bytes, image_decoder))
+        futures = {executor.submit(prescale_image, image_filepath, size): image_filepath
+                   for image_filepath in image_filepaths}
+        outcomes = ((futures[future], future.result()) for future in as_completed(futures))
+    try:
+        for done_count, (image_filepath, outcome) in enumerate(outcomes, 1):
+            if outcome in results:
+                results[outcome] += 1
+            else:
+                results['failed'] += 1
+                print("Failed to prescale", image_filepath, outcome)
+            now = time.perf_counter()
+            if now - last_report >= 1 or done_count == total:
+                last_report = now
+                print("prescaled %d/%d (%d%%) %.1f images/s" % (done_count, total,
+                      100 * done_count // total, done_count / (now - start)))
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    elapsed = time.perf_counter() - start
+    ScaledImageCache(cache_dir, budget_bytes).evict()
+    print("Prescaled %d, already cached %d, failed %d in %.1f s, %.1f images/s" % (results['scaled'],
+          results['cached'], results['failed'], elapsed, total / elapsed if elapsed > 0 else 0))
+    return results
+
+def idle_wait():
+    """ Blocks in the event queue until an event arrives or the next minute
+    starts, at most IDLE_MAX_WAIT_MS. Returns the events. """
+    now = time_source.now()
+    ms_to_minute = time_source.real_seconds((60 - now.second) - now.microsecond / 1000000) * 1000 + 1
+    wait_ms = int(min(ms_to_minute, IDLE_MAX_WAIT_MS))
+    if wait_ms <= 1:
+        return pygame.event.get()
+    if pygame.display.get_driver() in NATIVE_WAIT_DRIVERS:
+        event = pygame.event.wait(wait_ms)
+        if event.type == NOEVENT:
+            return []
+        return [event] + pygame.event.get()
+    deadline = time.monotonic() + wait_ms / 1000
+    while True:
+        events = pygame.event.get()
+        remaining = deadline - time.monotonic()
+        if events or remaining <= 0:
+            return events
+        time.sleep(min(remaining, IDLE_SLEEP_MS / 1000))
 
 def center_square(scr1):
     """ finds the center square of a surface (typically the screen surface)
@@ -174,35 +259,11 @@ def center_square(scr1):
     else:
         return pygame.Rect(0,(scr_height-scr_width)//2,scr_width,scr_width)
 
-class Fade_Surface(pygame.Surface):
-    """
-    should be called each clock as needed and returns a value to be used as an
-    alpha for fade from 255 to zero. can be nonlinear and decrements the index
-    each execution clock_step can be frame rate and cloc_start can be seconds
-    """
-    def __init__(self, w, h, flags=pygame.SRCALPHA, **args):
-        pygame.Surface.__init__(self, size=(w, h), flags=flags, **args)
-        self.alpha =255
-        self.clock_start=s.FRAME_RATE*s.FADE_SECONDS
-        self.clock_step1=int(s.FRAME_RATE*s.FADE_SECONDS)
-        self.surfacecopy = self.copy()
-        self.alphasurface = pygame.Surface((w,h),flags=pygame.SRCALPHA)
-        self.alphasurface.fill((255,255,255,255))
-    def fade_down(self,reset=False,start=255):
-        if reset==True:
-            self.alpha = min(start,255)
-            self.clock_start=s.FRAME_RATE*s.FADE_SECONDS
-            self.clock_step1=s.FRAME_RATE*s.FADE_SECONDS
-            reset=False
-#            self = self.surfacecopy.copy()
-            return self.blit(self.surfacecopy,(0,0))
-        else:
-            self.alpha = int(max(255*(self.clock_step1/self.clock_start),0))
-#            self.fill((0,0,0,255))
-            self.alphasurface.fill((255,255,255,self.alpha))
-            self.blit(self.surfacecopy,(0,0))
-            self.blit(self.alphasurface,(0,0), special_flags=pygame.BLEND_RGBA_MULT)
-            self.clock_step1 -= 1
+# names of the display states of LoopVars.State(). 0 is the first frame, which
+# includes drawing the analog clock.
+STATE_NAMES = {0: 'startup', 1: 'new minute image', 2: 'image static text', 3: 'image fading text',
+               4: 'image', 5: 'new minute analog', 6: 'analog static text',
+               7: 'analog fading text', 8: 'analog', 9: 'exit'}
 
 class LoopVars():
     """ display states per frame/loop
@@ -225,8 +286,10 @@ class LoopVars():
         self.image_index=0
         self.matched_images=0
         self.matched_image_selected=0
+        self.loaded_filepath=None # path of the image on screen
         self.analog_clock_active=0
-        self.time4_current=0
+        self.time4_current=-1 # no minute yet. 0 is midnight
+        self.screen_dirty=True
     """ Below are methods to change states and state variables. """
     def SetStartNewMinute(self):
         """ New minite initiated with or without image: states 1, 5 """
@@ -234,8 +297,9 @@ class LoopVars():
         self.fade_active=True
         self.fade_index=255
         self.time4_current=time4()
-        [self.image_index,self.matched_images] = hour_search(time4(), file_cat.image_file_list,self.image_index)
+        [self.image_index,self.matched_images] = file_cat.minute_search(self.time4_current)
         self.image_active = False
+        self.screen_dirty = True
     def SetContinueMinute(self):
         """ No new minute, opposite case of SetStartNewMinute:  many states """
         self.new_minute=False
@@ -251,6 +315,21 @@ class LoopVars():
              self.image_index = image_index
              self.matched_images =0
              return 0
+    def SetCatalogChanged(self, day):
+        """ The catalog was changed in place. Match the current minute again
+        without resetting the loop. The loaded image is kept if the same file
+        is still selected. The list has already changed, so the loaded image
+        is compared by its stored path and not by its old index. """
+        [image_index, matched_images] = file_cat.minute_search(self.time4_current)
+        self.SetImageMatched(image_index, matched_images)
+        if matched_images > 0:
+            self.SetImageSelected(select_image_index(image_index, matched_images, day))
+            if self.image_active is True and \
+            file_cat.image_file_list[self.matched_image_selected].image_filepath != self.loaded_filepath:
+                self.image_active = False
+        else:
+            self.SetNoImageMatched()
+        return [image_index, matched_images]
     def GetImageMatched(self):
         return [self.image_index,self.matched_images]
     def SetImageSelected(self, matched_image_selected):
@@ -259,8 +338,30 @@ class LoopVars():
         self.analog_clock_active=0
     def GetImageSelected(self):
         return self.matched_image_selected
-    def SetImageLoaded(self):
+    def SetImageLoaded(self, image_filepath):
         self.image_active=True
+        self.loaded_filepath=image_filepath
+        self.screen_dirty=True
+    def SetScreenDirty(self):
+        """ Something on screen must be drawn again """
+        self.screen_dirty=True
+    def SetScreenDrawn(self):
+        self.screen_dirty=False
+    def IsIdle(self):
+        """ True when an image is shown, the text has faded out and the
+        screen is up to date: state 4. Nothing needs to be drawn until the
+        next minute. """
+        return self.image_active is True and self.fade_active is False and self.screen_dirty is False
+    def State(self):
+        """ Returns the display state number of the class description. The
+        text is never static, so states 2 and 6 are not returned. """
+        if self.image_active is True:
+            if self.new_minute is True:
+                return 1
+            return 3 if self.fade_active is True else 4
+        if self.new_minute is True:
+            return 5
+        return 7 if self.fade_active is True else 8
     def SetNoImageMatched(self):
         """ No current image matched to display """
         self.image_active=False
@@ -274,17 +375,29 @@ class LoopVars():
 ##### Main execution starts. Functions defined.
 #####
 print("Processing files from directory:", IMAGE_PATH)
-file_cat = FileCatalog2(IMAGE_PATH)
+if s.CATALOG_INDEX is True:
+    CATALOG_INDEX_PATH = s.CATALOG_INDEX_PATH or os.path.join(IMAGE_PATH, INDEX_FILENAME)
+else:
+    CATALOG_INDEX_PATH = ''
+file_cat = FileCatalog2(IMAGE_PATH, CATALOG_INDEX_PATH, s.CATALOG_FOLLOW_SYMLINKS, s.CATALOG_SCAN_THREADS,
+                        s.CATALOG_READ_HEADERS, s.CATALOG_MAX_IMAGE_MEGAPIXELS * 1000000)
 file_cat.catalog_files()
 
 if args.invalidfiles is True:
     print("image files processed. total clocks:", len(file_cat.image_file_list))
     print("Total error files", len(file_cat.error_file_list))
     for obj in file_cat.error_file_list:
-        print (obj.image_filepath)
+        if obj.valid is False:
+            print (obj.image_filepath, " (image can not be decoded or is too large)")
+        else:
+            print (obj.image_filepath)
     print("\nExiting")
     quit()
 
+if args.missing >= 0 and args.json is True:
+    print(file_cat.return_missing(args.missing, 'json'))
+    quit()
+
 if args.missing >= 0:
     print("Listing the Missing clocks for hour",args.missing)
     print(file_cat.return_missing(args.missing))
@@ -305,44 +418,104 @@ if not pygame.image.get_extended():
     raise Exception("Pygame install isn't built with extended image support. Exiting")
 modes = pygame.display.list_modes()
 
+image_decoder = s.IMAGE_DECODER
+if image_decoder not in DECODERS:
+    print("Unknown image decoder", image_decoder, "using auto")
+    image_decoder = 'auto'
+if image_decoder == 'pillow' and not pillow_available():
+    print("Pillow is not installed, decoding images with pygame")
+if s.FADE_CURVE not in FADE_CURVES:
+    print("Unknown fade curve", s.FADE_CURVE, "using linear")
+    s.FADE_CURVE = 'linear'
+
+if args.prescale >= 0:
+    if args.prescale > 0:
+        prescale_side = args.prescale
+    elif args.fullscreen is True and modes and modes != -1:
+        prescale_side = min(max(modes))
+    else:
+        prescale_side = min(WINDOWED_SIZE)
+    prescale_catalog(file_cat, (prescale_side, prescale_side))
+    print("\nExiting")
+    quit()
+
 if args.fullscreen is True:
     screen=pygame.display.set_mode((0,0),pygame.FULLSCREEN|HWSURFACE|DOUBLEBUF)
     pygame.mouse.set_visible(False)
     print("Display in fullscreen. max display mode:", max(modes),
     "selected mode:", screen.get_size())
 else:
-    screen=pygame.display.set_mode((850,720),HWSURFACE|DOUBLEBUF|RESIZABLE)
+    screen=pygame.display.set_mode(WINDOWED_SIZE,HWSURFACE|DOUBLEBUF|RESIZABLE)
     print("Display in windowed mode:", screen.get_size(), " Apparent max mode:", max(modes))
 
 screen_width, screen_height= screen.get_size()
 centerRect = center_square(screen)
 print("centered square x,y,w,h: ", centerRect)
-print("frame rate:", s.FRAME_RATE)
+print("frame rate:", s.FRAME_RATE, "fading text frame rate:", s.FADE_FRAME_RATE)
 
 pygame.display.set_caption("Image Clock")
 pygame.event.set_blocked(pygame.MOUSEMOTION)
 
-# initiate the pygame Clock
-Clock = pygame.time.Clock()
+# Set up the frame rate governor with the loop rate of each display state.
+# The analog second hand needs the full rate, fading text a low rate and a
+# static image none, because the loop waits for events in idle_wait.
+governor = FrameRateGovernor({1: s.FRAME_RATE, 2: s.FADE_FRAME_RATE, 3: s.FADE_FRAME_RATE, 4: 0,
+                              5: s.FRAME_RATE, 6: s.FRAME_RATE, 7: s.FRAME_RATE, 8: s.FRAME_RATE},
+                             s.FRAME_RATE)
+if args.step > 0:
+    # a stepping clock runs as fast as possible
+    governor.rates = {}
+    governor.default_rate = 0
+fps_log_time = time.monotonic()
+minute_transition_seconds = [] # time to draw the first frame of each minute
+frame_stats = FrameStats() if args.stats_json else None
+first_frame = True
+if args.duration > 0:
+    # counted from the start of the first minute, so the run covers whole minutes
+    end_time = time_source.now().replace(second=0, microsecond=0) + timedelta(minutes=args.duration)
 
 # Initialize the analog clock timepiece
 a_clock = AnalogTimepiece(screen, centerRect, s.FRAME_RATE)
 
-# Create fonts. Use default system font if fonts not loaded.
-if FONTPATH_TIME:
-    introFont = pygame.font.Font(FONTPATH_TIME, int(screen_height*(s.TIME_FONT_PERCENT/200)))
-    timeFont = pygame.font.Font(FONTPATH_TIME, int(screen_height*(s.TIME_FONT_PERCENT/100)))
-    dateFont = pygame.font.Font(FONTPATH_DATE, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
-    nextImageFont = pygame.font.Font(FONTPATH_NEXT, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
-else:
-    DEFAULT_FONT = pygame.font.get_default_font()
-    introFont = pygame.font.SysFont(DEFAULT_FONT, int(screen_height*(s.TIME_FONT_PERCENT/200)))
-    timeFont = pygame.font.SysFont(DEFAULT_FONT, int(screen_height*(s.TIME_FONT_PERCENT/100)))
-    dateFont = pygame.font.SysFont(DEFAULT_FONT, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
-    nextImageFont = pygame.font.SysFont(DEFAULT_FONT, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
+# Set up the image loader with the in-memory and on-disk caches of scaled images
+scaled_image_cache = None
+if s.IMAGE_CACHE is True:
+    try:
+        scaled_image_cache = ScaledImageCache(s.IMAGE_CACHE_PATH or IMAGE_CACHE_PATH, s.IMAGE_CACHE_SIZE_MB * 1024 * 1024)
+    except OSError as err:
+        print("Scaled image cache not available:", err)
+surface_cache = SurfaceCache(s.IMAGE_CACHE_MEMORY_MB * 1024 * 1024) if s.IMAGE_CACHE_MEMORY_MB > 0 else None
+image_loader = ImageLoader(scaled_image_cache, surface_cache, image_decoder)
+
+# Create fonts from the shared font cache. An empty font path loads the
+# default system font. The date and next image fonts are the same font.
+if not FONTPATH_TIME:
+    FONTPATH_DATE = FONTPATH_NEXT = ""
+introFont = font_cache.get(FONTPATH_TIME, int(screen_height*(s.TIME_FONT_PERCENT/200)))
+timeFont = font_cache.get(FONTPATH_TIME, int(screen_height*(s.TIME_FONT_PERCENT/100)))
+dateFont = font_cache.get(FONTPATH_DATE, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
+nextImageFont = font_cache.get(FONTPATH_NEXT, int(screen_height*(s.TIME_FONT_PERCENT/100)*.3))
+# The labels are rendered again only when their text changes
+timeTextLabel = TextLabel(timeFont, s.TYPE_COLOR)
+dateTextLabel = TextLabel(dateFont, s.TYPE_COLOR)
+nextImageTextLabel = TextLabel(nextImageFont, (200,200,200))
 
 text_rect = pygame.Rect(0,0,0,0)
 
+# The frame timing overlay in the top left corner, toggled with h
+hud = FrameHUD((0,0), font_cache.get("", max(16, screen_height // 40)))
+if args.hud is True:
+    hud.toggle()
+
+# The layers of the screen, bottom first. Each frame only the areas where a
+# layer changed are drawn and updated on the display.
+fill_layer = FillLayer(screen.get_rect())
+analog_layer = AnalogClockLayer(a_clock)
+image_layer = ImageLayer()
+label_layer = LabelLayer()
+scene = SceneCompositor(screen, [fill_layer, analog_layer, image_layer, label_layer, hud])
+scene.invalidate()
+
 #####
 ##### Define variables for game loop control and initialization.
 ##### Includes variables these need to persist beyond each loop instance.
@@ -351,11 +524,37 @@ text_rect = pygame.Rect(0,0,0,0)
 done = False # whether no exit signal give to exit the loop
 c_index = 0
 c_match = 0
-timeLabelFade = Fade_Surface(0,0)
-dateLabelFade = Fade_Surface(0,0)
-nextImageFade = Fade_Surface(0,0)
+timeLabelFade = FadeText(Surface((0,0)), 0)
+dateLabelFade = FadeText(Surface((0,0)), 0)
 
 LC = LoopVars() # Loop control class object
+metrics = None # the statistics of the metrics server, if it runs
+def prefetch_load(image_filepath, size):
+    """ Loads an image in the prefetch worker and records the load time """
+    load_start = time.perf_counter()
+    surface = image_loader.load(image_filepath, size)
+    if metrics is not None:
+        metrics.record_image_load('prefetch', time.perf_counter() - load_start)
+    return surface
+prefetcher = ImagePrefetcher(prefetch_load) # loads the image of the next minute in the background
+prefetch_time4 = -1 # the minute the prefetcher was last asked to load
+next_minute_analog = False # the next minute has no image and shows the analog clock
+
+# Serve the metrics for monitoring. The server thread only reads what the
+# game loop and the prefetch worker record.
+metrics_server = None
+if s.METRICS is True or args.metrics is True:
+    metrics = ClockMetrics(STATE_NAMES)
+    metrics.cache_sources = {name: source for name, source in (('memory', surface_cache),
+                             ('disk', scaled_image_cache), ('prefetch', prefetcher)) if source is not None}
+    metrics.catalog = catalog_snapshot(file_cat)
+    metrics_server = MetricsServer(metrics, s.METRICS_ADDRESS, s.METRICS_PORT, s.METRICS_SOCKET)
+    try:
+        metrics_server.start()
+        print("Serving metrics at", s.METRICS_SOCKET or "http://%s:%d/metrics" % (s.METRICS_ADDRESS, metrics_server.port))
+    except OSError as err:
+        print("Metrics server not started:", err)
+        metrics = metrics_server = None
 
 # set up the signal handler.
 # NOTE: This is not the best practice, but unfortunately I think the 2 function
@@ -365,32 +564,68 @@ def signal10():
     # execute functions to re-catalog the files and reset clock state
     file_cat.clear_catalog_files()
     file_cat.catalog_files()
+    if metrics is not None:
+        metrics.catalog = catalog_snapshot(file_cat)
     LC.ResetAll()
 def signal12():
     # reserved for future use.
     pass
 sig = SignalHandler(signal10,signal12)
 
-# Text to display when screen is blank. Does not work.
+# Watch the image directory and queue changes for the game loop, which applies
+# them to the catalog in place.
+catalog_changes = queue.Queue()
+def catalog_changed(action, pathname):
+    catalog_changes.put((action, pathname))
+    pygame.event.post(pygame.event.Event(CATALOG_EVENT))
+def apply_catalog_changes():
+    """ Applies the queued file changes to the catalog. Returns True if the
+    catalog changed. """
+    changed = False
+    while not catalog_changes.empty():
+        action, pathname = catalog_changes.get_nowait()
+        if args.verbose is True:
+            print("image directory change:", action, pathname)
+        if action == 'added':
+            changed = file_cat.add_file(pathname) or changed
+        elif action == 'removed':
+            changed = file_cat.remove_file(pathname) or changed
+        elif action == 'removed_tree':
+            changed = file_cat.remove_directory(pathname) or changed
+        elif action == 'rescan':
+            file_cat.clear_catalog_files()
+            file_cat.catalog_files()
+            changed = True
+    return changed
+if s.CATALOG_WATCH is True:
+    watcher = start_watcher(IMAGE_PATH, catalog_changed, s.CATALOG_WATCH_POLL_SECONDS, s.CATALOG_FOLLOW_SYMLINKS)
+
+# Text to display until the first frame is drawn
 introTextSurf = introFont.render("Preparing clock. Standby...", True, s.TYPE_COLOR)
-screen.blit(introTextSurf, (centerRect.x+10, centerRect.y+50))
+pygame.display.update(screen.blit(introTextSurf, (centerRect.x+10, centerRect.y+50)))
 #####
 ##### Game Loop starts here.
 #####
 while(not done):
-    now_time = datetime.now()
-    if LC.image_index == len(file_cat.image_file_list):
-    # reset the variables to zero if we have reached the end of the list
-        LC.ResetAll()
+    frame_start = time.perf_counter()
+    frame_blits = 0
+    frame_dirty_area = 0
+    now_time = time_source.next_frame()
+    if args.duration > 0 and now_time >= end_time:
+        break
+    if not catalog_changes.empty() and apply_catalog_changes() is True:
+        [c_index, c_match] = LC.SetCatalogChanged(now_time.day)
+        if metrics is not None:
+            metrics.catalog = catalog_snapshot(file_cat)
     if LC.time4_current != time4():
     # flag new minutes to reduce unnecessary execution in loops
         LC.SetStartNewMinute()
-        [c_index, c_match] = hour_search(time4(), file_cat.image_file_list,LC.image_index)
+        [c_index, c_match] = file_cat.minute_search(LC.time4_current)
         LC.SetImageMatched(c_index, c_match)
     else:
         LC.SetContinueMinute()
 ## Start of Test code comment out for normal run """
-#    [c_index, c_match] = hour_search(1200, image_file_list,0)  #### FOR TESTING
+#    [c_index, c_match] = file_cat.minute_search(1200)  #### FOR TESTING
 #    LC.SetStartNewMinute()
 #    LC.SetImageMatched(c_index, c_match)
 ## End of test code
@@ -401,25 +636,28 @@ while(not done):
     """
     if LC.matched_images >=1:
         # if there's at least one matching image, display an image
-        LC.SetImageSelected(LC.image_index)
-        if LC.matched_images > 1:
-            #if there's a match on more than one image, select one based on day
-            LC.SetImageSelected(LC.image_index + (now_time.day // (30 // LC.matched_images)))
+        #if there's a match on more than one image, select one based on day
+        LC.SetImageSelected(select_image_index(LC.image_index, LC.matched_images, now_time.day))
         if LC.image_active is False:
-        # If an image hasn't been loaded yet, load it. This is processor intensive
-            ImgSurface = pygame.image.load(file_cat.image_file_list[LC.matched_image_selected].image_filepath)
-            ImgSurface = ImgSurface.convert()
-            tempX,tempY=ImgSurface.get_size()
-            ratio = tempX/tempY
+        # If an image hasn't been loaded yet, take it from the prefetch or load it.
+            image_filepath = file_cat.image_file_list[LC.matched_image_selected].image_filepath
             tempSize = (centerRect.w,centerRect.h)
             if args.verbose is True:
                 print("time: ",file_cat.image_file_list[LC.matched_image_selected].clock4, \
                       "match image index: ",c_index,"matches: ",c_match, \
                     "selected display index: ",LC.matched_image_selected)
-                print (str(ImgSurface.get_size())+" to "+ str(tempSize) +"and ratio: "+str(ratio))
-            # rescale the image to fit the current display
-            ImgSurface = pygame.transform.smoothscale(ImgSurface, tempSize)
-            LC.SetImageLoaded()
+            ImgSurface = prefetcher.take(image_filepath, tempSize)
+            if ImgSurface is None:
+                # The prefetch missed. This is processor intensive
+                load_start = time.perf_counter()
+                ImgSurface = image_loader.load(image_filepath, tempSize)
+                if metrics is not None:
+                    metrics.record_image_load('loop', time.perf_counter() - load_start)
+                if args.verbose is True:
+                    print ("loaded "+ image_filepath +" to "+ str(tempSize))
+            elif args.verbose is True:
+                print ("prefetched "+ image_filepath +" to "+ str(tempSize))
+            LC.SetImageLoaded(image_filepath)
 
     if LC.matched_images == 0:
         """
@@ -434,13 +672,16 @@ while(not done):
         """
         timeText=now_time.strftime("%I:%M%p")
         dateText=now_time.strftime("%B %d, %Y")
-        nextImageText = "next " + str(file_cat.image_file_list[c_index].clock4 // 100)+\
-        ":"+ str((file_cat.image_file_list[c_index].clock4 % 100) // 10)+\
-        str((file_cat.image_file_list[c_index].clock4 % 100) % 10)
-        #font.render(text, antialias, color, background=None) -> Surface
-        timeLabel = timeFont.render(timeText, True, s.TYPE_COLOR)
-        dateLabel = dateFont.render(dateText, True, s.TYPE_COLOR)
-        nextImageLabel = nextImageFont.render(nextImageText, True, (200,200,200))
+        next_index = file_cat.next_image(LC.time4_current)
+        if next_index >= 0:
+            nextImageText = "next " + str(file_cat.image_file_list[next_index].clock4 // 100)+\
+            ":"+ str((file_cat.image_file_list[next_index].clock4 % 100) // 10)+\
+            str((file_cat.image_file_list[next_index].clock4 % 100) % 10)
+        else:
+            nextImageText = "no images"
+        timeLabel = timeTextLabel.render(timeText)
+        dateLabel = dateTextLabel.render(dateText)
+        nextImageLabel = nextImageTextLabel.render(nextImageText)
 
         timeLabelRect = timeLabel.get_rect()
         dateLabelRect = dateLabel.get_rect()
@@ -453,61 +694,87 @@ while(not done):
         dateLabelRect.topleft = (centerRect.x+centerRect.w-dateWidth-10, centerRect.y+centerRect.h-dateHeight-nextImageHeight-20)
         nextImageLabelRect.topleft = (centerRect.x+centerRect.w-nextImageWidth-10, centerRect.y+centerRect.h-nextImageHeight-20)
 
-        timeLabelFade = Fade_Surface(timeWidth, timeHeight, SRCALPHA)
-        dateLabelFade = Fade_Surface(dateWidth, dateHeight, SRCALPHA)
-        nextImageFade = Fade_Surface(nextImageWidth, nextImageHeight, SRCALPHA)
-
-        timeLabelFade.fill((0,0,0,0))
-        dateLabelFade.fill((0,0,0,0))
-        nextImageFade.fill((0,0,0,0))
-
-        dateLabelFade.blit(dateLabel,(0,0))
-        timeLabelFade.blit(timeLabel,(0,0))
-        nextImageFade.blit(nextImageLabel, (0,0))
-
-        timeLabelFade.fade_down(True,240) #prepare fade with a start alpha
-        dateLabelFade.fade_down(True,240)
-        nextImageFade.fade_down(True)
+        # The labels are faded with their surface alpha, from a start alpha
+        timeLabelFade = FadeText(timeLabel, 240, clock=time_source.monotonic)
+        dateLabelFade = FadeText(dateLabel, 240, clock=time_source.monotonic)
+        label_layer.set_label('time', timeLabel, timeLabelRect)
+        label_layer.set_label('date', dateLabel, dateLabelRect)
+        # the next image text is shown over the analog clock while the text fades
+        if LC.image_active is False:
+            label_layer.set_label('next', nextImageLabel, nextImageLabelRect)
+        else:
+            label_layer.remove_label('next')
     if timeLabelFade.alpha > 0:
         # If the text is visible, perform fading operations.
         # Do not fade the next image text.
-        timeLabelFade.fill((0,0,0,0))
-        dateLabelFade.fill((0,0,0,0))
-        timeLabelFade.blit(timeLabel,(0,0))
-        dateLabelFade.blit(dateLabel,(0,0))
-        timeLabelFade.fade_down(False) # fade only the time and date
-        dateLabelFade.fade_down(False)
-    # Perform blits to screen.
-    # conditions based on whether there is an image to display
-    if LC.new_minute is True and LC.image_active is False:
-        # screen.fill((0,0,0),centerRect)
-        a_clock.blit_request(centerRect)
+        previous_alpha = timeLabelFade.alpha
+        timeLabelFade.update() # fade only the time and date
+        dateLabelFade.update()
+        if timeLabelFade.alpha == 0:
+            for name in ('time', 'date', 'next'):
+                label_layer.remove_label(name)
+        elif timeLabelFade.alpha != previous_alpha:
+            label_layer.touch('time')
+            label_layer.touch('date')
+        LC.SetScreenDirty()
+    LC.fade_active = timeLabelFade.alpha > 0
+    # Show the image of the minute or the analog clock under it.
     if LC.image_active is True:
-        screen.blit(ImgSurface, (centerRect.x, centerRect.y))
-    if LC.image_active is False:
-        # Blit the analog clock changes.
-        a_clock.blit_changes()
-    if LC.image_active is False and timeLabelFade.alpha > 0:
-        # If the analog clock is running, blit the portions under the text.
-        a_clock.blit_request(nextImageLabelRect)
-        a_clock.blit_request(timeLabelRect)
-        a_clock.blit_request(dateLabelRect)
-        screen.blit(nextImageLabel,nextImageLabelRect)
-    if  timeLabelFade.alpha > 0:
-        # Always blit the fading text
-        screen.blit(timeLabelFade, timeLabelRect)
-        screen.blit(dateLabelFade, dateLabelRect)
-
+        if image_layer.image is not ImgSurface:
+            image_layer.set_image(ImgSurface, centerRect)
+    elif image_layer.image is not None:
+        image_layer.set_image(None)
+    analog_layer.set_active(LC.image_active is False)
+    # Draw the changed areas of the screen unless the screen is idle.
+    if LC.IsIdle() is False or hud.visible is True:
+        update_rects = scene.compose()
+        if update_rects:
+            pygame.display.update(update_rects)
+        frame_blits = scene.last_blits
+        if hud.enabled is True:
+            frame_dirty_area = sum(rect.w * rect.h for rect in update_rects)
+        LC.SetScreenDrawn()
     if LC.new_minute is True:
-        pygame.display.flip()
-    else:
-        pygame.display.update(centerRect)
+        minute_transition_seconds.append(time.perf_counter() - frame_start)
+
+    # Prefetch the image of the next minute while this minute is displayed.
+    if LC.new_minute is False:
+        next_time = now_time + timedelta(minutes=1)
+        next_time4 = next_time.hour*100 + next_time.minute
+        if prefetch_time4 != next_time4:
+            prefetch_time4 = next_time4
+            [p_index, p_match] = file_cat.minute_search(next_time4)
+            next_minute_analog = p_match == 0
+            if p_match > 0:
+                prefetcher.request(file_cat.image_file_list[select_image_index(p_index, p_match, next_time.day)].image_filepath,
+                                   (centerRect.w,centerRect.h))
+    # Render the second hand of the analog clock ahead of time in part of the
+    # frame, while the analog clock is shown or is shown next. The frames not
+    # rendered yet are rendered when they are shown.
+    if a_clock.sprites_ready is False and (LC.image_active is False or next_minute_analog is True):
+        if a_clock.warm_up(s.ANALOG_WARMUP_BUDGET_MS / 1000) is True and args.verbose is True:
+            print("analog clock second hand rendered,", a_clock.sprite_misses, "frames when first shown")
+    frame_state = 0 if first_frame is True else LC.State()
+    first_frame = False
 
 ##### Image operations complete.
 ##### Next execution blocks are run for each loop for housekeeping and exit control.
-    for event in pygame.event.get():  # Hit the ESC key to quit.
+    idle_seconds = 0.0
+    if LC.IsIdle() is True:
+        # Nothing on screen changes. Sleep until an event or the next minute
+        # instead of drawing the same frame again.
+        idle_start = time.perf_counter()
+        events = idle_wait()
+        idle_seconds = time.perf_counter() - idle_start
+    else:
+        events = pygame.event.get()
+    for event in events:  # Hit the ESC key to quit.
         if event.type == KEYDOWN and event.key == K_b:
             breakpoint()
+        elif event.type == KEYDOWN and event.key == K_h:
+            # the layers under the overlay are drawn again when it is turned off
+            hud.toggle()
+            LC.SetScreenDirty()
         elif (event.type == QUIT or
             (event.type == KEYDOWN and (event.key == K_ESCAPE or event.key == K_q))):
             done = True
@@ -515,12 +782,44 @@ while(not done):
             screen=pygame.display.set_mode(event.dict['size'],HWSURFACE|DOUBLEBUF|RESIZABLE)
             screen_width, screen_height= screen.get_size()
             centerRect = center_square(screen)
+            scene.surface = screen
+            fill_layer.rect = screen.get_rect()
+            scene.invalidate()
             analogClockRect = centerRect.copy()
             screen.blit(pygame.transform.smoothscale(screen,event.dict['size']),(centerRect.h,centerRect.w))
             LC.ResetAll()
-    Clock.tick(s.FRAME_RATE) # tick the clock at the given frame rate
+            prefetch_time4 = -1 # prefetch again for the new size
+        elif event.type == VIDEOEXPOSE:
+            scene.invalidate()
+            LC.SetScreenDirty()
+    # The work of the frame includes the display update and the event
+    # handling, but not the idle wait or the wait for the next frame.
+    frame_work = time.perf_counter() - frame_start - idle_seconds
+    if metrics is not None:
+        frame_rate = governor.rate(frame_state)
+        metrics.record_frame(frame_state, frame_work, 1 / frame_rate if frame_rate > 0 else 0)
+    if hud.enabled is True:
+        hud.record(frame_work, frame_blits, analog_layer.last_blits, frame_dirty_area, governor.clock.get_fps())
+    governor.tick(LC.State()) # tick the clock at the frame rate of the display state
+    if frame_stats is not None:
+        frame_stats.record(frame_state, frame_work, time.perf_counter() - frame_start, frame_blits)
+    if args.verbose is True and time.monotonic() - fps_log_time >= FPS_LOG_SECONDS:
+        fps_log_time = time.monotonic()
+        print("effective fps by display state:",
+              ", ".join("%d: %.1f" % (state, fps) for state, fps in governor.report().items()))
 
 ##### End of main loop.
 ##### Everything after this is program cleanup.
 print("Exiting")
+if args.verbose is True or time_source.simulated is True:
+    print("minute transitions:", duration_summary(minute_transition_seconds))
+if args.verbose is True and surface_cache is not None:
+    print("surface cache:", surface_cache.stats())
+if frame_stats is not None:
+    with open(args.stats_json, 'w') as f:
+        json.dump({'framerate': s.FRAME_RATE, 'states': frame_stats.summary(STATE_NAMES),
+                   'minute_transitions_ms': [1000 * seconds for seconds in minute_transition_seconds]}, f, indent=2)
+if metrics_server is not None:
+    metrics_server.shutdown()
+prefetcher.shutdown()
 pygame.quit()
@@ -24,38 +24,133 @@
 This enumerates the files and prepares data structures for clock_main.py
 
 """
+import json
 import os
-import stat
+import sqlite3
+from array import array
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import closing
+
+from image_headers import read_image_size
+
+# default file name of the catalog index that is stored in the image root
+INDEX_FILENAME = ".image-clock-catalog.sqlite"
+# file extensions of the image types that are cataloged
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp')
+MINUTES_PER_DAY = 1440
+
+def time4_to_minute(time4 :int):
+    """ converts a 4 digit time HHMM to the minute of the day """
+    return (time4 // 100) * 60 + time4 % 100
 
 class FileRecord:
     """
     The file_catalog class creates a data storage and enumeration construct for
     parsing the input files. This class is called by FileCatalog2.
+    The attributes are fixed with __slots__ to keep large catalogs compact.
     """
+    __slots__ = ('clock4', 'image_filepath', 'height', 'width', 'description', 'valid')
     def __init__(self, clock4 :int, image_filepath :str, description :str):
         self.clock4 = int(clock4) #time in four digits e.g. 1615 is 4:15 PM
         self.image_filepath = str(image_filepath)
         self.height = int()
         self.width = int()
         self.description = str(description)
+        self.valid = True # False if the image header could not be read
     def __iter__(self): #makes this class object iterable
         pass
 
+class CatalogIndex:
+    """
+    A persistent index of cataloged files stored in a SQLite database. Each
+    file is keyed by its path, size and modification time so that a rescan
+    only needs to parse the file names that are new or changed since the last
+    scan.  The index is a cache and may be deleted at any time.
+    """
+    SCHEMA_VERSION = 2
+
+    def __init__(self, index_filepath :str):
+        self.index_filepath = index_filepath
+
+    def _connect(self):
+        connection = sqlite3.connect(self.index_filepath)
+        if connection.execute("PRAGMA user_version").fetchone()[0] != self.SCHEMA_VERSION:
+            # the index is only a cache, so an old layout is simply rebuilt.
+            connection.execute("DROP TABLE IF EXISTS files")
+            connection.execute("PRAGMA user_version = %d" % self.SCHEMA_VERSION)
+        connection.execute("""CREATE TABLE IF NOT EXISTS files (
+                              path TEXT PRIMARY KEY,
+                              size INTEGER,
+                              mtime INTEGER,
+                              clock4 INTEGER,
+                              clock4_alt INTEGER,
+                              description TEXT,
+                              width INTEGER,
+                              height INTEGER,
+                              valid INTEGER)""")
+        return connection
+
+    def load(self):
+        """ Returns a dictionary of all indexed files keyed by path. The values
+        are tuples of (size, mtime, clock4, clock4_alt, description, width,
+        height, valid) """
+        with closing(self._connect()) as connection:
+            rows = connection.execute("SELECT path, size, mtime, clock4, clock4_alt, description, width, height, valid FROM files")
+            return {row[0]: row[1:] for row in rows}
+
+    def update(self, changed_rows, deleted_paths):
+        """ Writes the changed rows and removes deleted paths in a single
+        transaction. changed_rows are tuples of (path, size, mtime, clock4,
+        clock4_alt, description, width, height, valid) """
+        with closing(self._connect()) as connection:
+            with connection:
+                connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", changed_rows)
+                connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in deleted_paths))
+
 class FileCatalog2:
     """
     The file_catalog class creates a data storage and enumeration construct for
     parsing the input files. It contains the filename text parsing logic
+
+    If an index_filepath is given, the results of the file name parsing are
+    kept in a CatalogIndex and files whose size and modification time are
+    unchanged are not parsed again on the next catalog_files call.
+
+    If read_headers is set, the image size of new and changed files is read
+    from the file header and files that can not be decoded, or that have more
+    than max_pixels pixels, are moved to the error_file_list.
     """
-    def __init__(self,image_filepath :str):
+    def __init__(self,image_filepath :str, index_filepath :str = '',
+                 follow_symlinks :bool = True, scan_workers :int = 1,
+                 read_headers :bool = True, max_pixels :int = 0):
         self.image_file_list: list[FileRecord] = list()
         self.error_file_list: list[FileRecord] = list()
         self.image_filepath = image_filepath
+        self.follow_symlinks = follow_symlinks
+        self.scan_workers = scan_workers
+        self.index = CatalogIndex(index_filepath) if index_filepath else None
+        # index entries of the previous scan and changes found in this scan
+        self.indexed_files = dict()
+        self.index_changes = list()
+        self.read_headers = read_headers
+        self.max_pixels = max_pixels # 0 for no limit
+        # records of this scan waiting for their image headers to be read
+        self.pending_headers = list()
+        # minute slot index into image_file_list. See build_slot_index.
+        self.slot_start = array('i', [0]) * MINUTES_PER_DAY
+        self.slot_count = array('i', [0]) * MINUTES_PER_DAY
+        self.slot_next = array('i', [-1]) * MINUTES_PER_DAY
 
     def tag_file(self, file :str):
         f = os.path.split(file)[1]
         temp_file_record=list()
         temp_file_record.append(FileRecord(-1, "", ""))
         clock4 = int() #time in four digits e.g. 1615 is 4:15 PM
+        if not f[1:5].isdigit():
+            # not a time in the file name, the checks below would fail to convert it.
+            temp_file_record[0].description = str(f[5:])
+            temp_file_record[0].image_filepath = str(file)
+            return temp_file_record
         if f[0] in ["a","A"] and int(f[1:3]) == 12 \
         and int(f[3:5]) <= 59:
             temp_file_record[0].clock4 = 0000 + int(f[3:5])
@@ -95,141 +190,450 @@ class FileCatalog2:
         return temp_file_record
 
 
-    def walktree(self, top: str, callback):
+    def scan_directory(self, top: str, follow_symlinks=True, with_stat=False):
         """
-        recursively descend the directory tree rooted at top, calling the
-        callback function for each regular file. Taken from the module-stat
-        example at: http://docs.python.org/lib/module-stat.html
+        Lists one directory with os.scandir and returns a tuple of the image
+        files as (pathname, stat) pairs and the subdirectories as (pathname,
+        key) pairs. The file type comes from the cached DirEntry information,
+        so a file is only stat'ed if it has an image extension and with_stat
+        is set. The key of a subdirectory identifies it for loop detection
+        when following symlinks.
         """
-        for f in os.listdir(top):
-            pathname = os.path.join(top, f)
-            mode = os.stat(pathname)[stat.ST_MODE]
-            if stat.S_ISDIR(mode):
-                # It's a directory, recurse into it
-                self.walktree(pathname, callback)
-            elif stat.S_ISREG(mode):
-                # It's a file, call the callback function
-                callback(pathname)
-            else:
-                # Unknown file type, print a message
-                print ('Skipping %s' % pathname)
+        files = []
+        subdirs = []
+        try:
+            with os.scandir(top) as entries:
+                for entry in entries:
+                    if not follow_symlinks and entry.is_symlink():
+                        continue
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if follow_symlinks:
+                            entry_stat = entry.stat()
+                            subdirs.append((entry.path, (entry_stat.st_dev, entry_stat.st_ino)))
+                        else:
+                            subdirs.append((entry.path, None))
+                    elif entry.is_file(follow_symlinks=follow_symlinks):
+                        # filter by extension before any further system calls.
+                        if os.path.splitext(entry.name)[1].lower() in IMAGE_EXTENSIONS:
+                            file_stat = entry.stat(follow_symlinks=follow_symlinks) if with_stat else None
+                            files.append((entry.path, file_stat))
+                    else:
+                        # Unknown file type, print a message
+                        print ('Skipping %s' % entry.path)
+        except OSError as err:
+            print ('Skipping %s: %s' % (top, err))
+        return files, subdirs
+
+    def walktree(self, top: str, callback, follow_symlinks=True, workers=1, with_stat=False):
+        """
+        Descend the directory tree rooted at top without recursion, calling the
+        callback function for each image file. With more than one worker the
+        subdirectories are listed in parallel by a thread pool, which helps on
+        slow storage. The callback is always called from the calling thread.
+        """
+        visited = set()
+        if follow_symlinks:
+            top_stat = os.stat(top)
+            visited.add((top_stat.st_dev, top_stat.st_ino))
+
+        def new_subdirs(subdirs):
+            """ returns the subdirectories that have not been walked yet """
+            for pathname, key in subdirs:
+                if key is not None:
+                    if key in visited:
+                        print ('Skipping %s: directory already cataloged' % pathname)
+                        continue
+                    visited.add(key)
+                yield pathname
+
+        if workers > 1:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                pending = {executor.submit(self.scan_directory, top, follow_symlinks, with_stat)}
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        files, subdirs = future.result()
+                        for pathname, file_stat in files:
+                            callback(pathname, file_stat=file_stat)
+                        for pathname in new_subdirs(subdirs):
+                            pending.add(executor.submit(self.scan_directory, pathname, follow_symlinks, with_stat))
+        else:
+            stack = [top]
+            while stack:
+                files, subdirs = self.scan_directory(stack.pop(), follow_symlinks, with_stat)
+                for pathname, file_stat in files:
+                    callback(pathname, file_stat=file_stat)
+                stack.extend(new_subdirs(subdirs))
 
 
-    def addtolist(self, file, extensions=['.png', '.jpg', '.jpeg', '.gif', '.bmp']):
+    def addtolist(self, file, extensions=IMAGE_EXTENSIONS, file_stat=None):
         """
         evaulates the file type and naming format and, if compliant,
         creates a new class instance in a list.
 
+        If the file is unchanged since the last indexed scan, the records are
+        rebuilt from the index instead of parsing the file name again.
         """
         filename, ext = os.path.splitext(file)
         e = ext.lower()
             # Only add common image types to the list.
         if e in extensions:
-            new_record = self.tag_file(file)
-            if new_record[0].clock4 >= 0:
-                self.image_file_list = self.image_file_list + new_record
+            new_record = None
+            if self.index is not None:
+                if file_stat is None:
+                    file_stat = os.stat(file)
+                new_record = self.indexed_records(file, file_stat)
+            if new_record is None:
+                new_record = self.tag_file(file)
+                if self.read_headers is True and new_record[0].clock4 >= 0:
+                    # read later with all other new files in a thread pool
+                    self.pending_headers.append((new_record, file_stat))
+                    return
+                self.queue_index_change(new_record, file_stat)
+            self.file_records(new_record)
+
+    def file_records(self, new_record):
+        """ Adds the records of one file to the image or the error list """
+        if new_record[0].clock4 >= 0 and new_record[0].valid is True:
+            self.image_file_list.extend(new_record)
+        else:
+            # a file with two times is only listed once as an error
+            self.error_file_list.append(new_record[0])
+
+    def indexed_records(self, file :str, file_stat):
+        """ Returns the records of a file from the index if the size and
+        modification time are unchanged, otherwise None. """
+        entry = self.indexed_files.pop(file, None)
+        if entry is not None and entry[0] == file_stat.st_size and entry[1] == file_stat.st_mtime_ns:
+            description = entry[4]
+            new_record = [FileRecord(entry[2], file, description)]
+            if entry[3] is not None:
+                new_record.append(FileRecord(entry[3], file, description))
+            for record in new_record:
+                record.width, record.height, record.valid = entry[5], entry[6], bool(entry[7])
+            return new_record
+        return None
+
+    def queue_index_change(self, new_record, file_stat):
+        """ Queues the records of a new or changed file to be written to the index """
+        if self.index is None or file_stat is None:
+            return
+        clock4_alt = new_record[1].clock4 if len(new_record) > 1 else None
+        self.index_changes.append((new_record[0].image_filepath, file_stat.st_size, file_stat.st_mtime_ns,
+                                   new_record[0].clock4, clock4_alt, new_record[0].description,
+                                   new_record[0].width, new_record[0].height, int(new_record[0].valid)))
+
+    def image_header_size(self, file :str):
+        """ Returns the (width, height) of an image from its header, or None
+        if the image can not be decoded or is larger than max_pixels """
+        try:
+            width, height = read_image_size(file)
+        except (OSError, ValueError):
+            return None
+        if self.max_pixels > 0 and width * height > self.max_pixels:
+            return None
+        return width, height
+
+    def set_image_size(self, new_record, size):
+        """ Sets the image size of the records of one file, or marks them
+        invalid if size is None """
+        for record in new_record:
+            if size is None:
+                record.valid = False
             else:
-                self.error_file_list = self.error_file_list + new_record
+                record.width, record.height = size
+
+    def read_pending_headers(self):
+        """ Reads the image headers of the new and changed files of this scan
+        in a thread pool and files the records. """
+        pending = self.pending_headers
+        self.pending_headers = list()
+        paths = [new_record[0].image_filepath for new_record, file_stat in pending]
+        with ThreadPoolExecutor(max_workers=max(1, self.scan_workers)) as executor:
+            sizes = executor.map(self.image_header_size, paths)
+            for (new_record, file_stat), size in zip(pending, sizes):
+                self.set_image_size(new_record, size)
+                self.queue_index_change(new_record, file_stat)
+                self.file_records(new_record)
 
     def catalog_files(self):
         """ This method is called externally.
         """
-        self.walktree(self.image_filepath,self.addtolist)
-        self.image_file_list = sorted(self.image_file_list, key=lambda image_file_list: image_file_list.clock4) # Thank you stackoverflow
+        if self.index is not None:
+            try:
+                self.indexed_files = self.index.load()
+            except sqlite3.Error as err:
+                print("Catalog index", self.index.index_filepath, "could not be read:", err,
+                      " Continuing without an index.")
+                self.index = None
+        self.walktree(self.image_filepath, self.addtolist, self.follow_symlinks,
+                      self.scan_workers, with_stat=self.index is not None)
+        if self.pending_headers:
+            self.read_pending_headers()
+        if self.index is not None:
+            # any indexed files that were not seen in this scan have been deleted
+            try:
+                self.index.update(self.index_changes, self.indexed_files.keys())
+            except sqlite3.Error as err:
+                print("Catalog index", self.index.index_filepath, "could not be written:", err)
+            self.indexed_files = dict()
+            self.index_changes = list()
+        # sort once in place, by path within a minute so the order does not
+        # depend on the scan order.
+        self.image_file_list.sort(key=lambda image_file_list: (image_file_list.clock4, image_file_list.image_filepath)) # Thank you stackoverflow
+        self.error_file_list.sort(key=lambda record: record.image_filepath)
+        self.build_slot_index()
 
     def clear_catalog_files(self):
         """ This method is called externally.
         """
         self.image_file_list.clear()
         self.error_file_list.clear()
+        self.build_slot_index()
 
-    def return_missing(self, hour=-1):
-        """ This method is called externally.
-            Returns all the missing clocks as a string.  If the hour is defined
-            as 24, then then only from that particular hour.
+    def build_slot_index(self):
         """
-        def time4_to_str(input: int):
-            """ outputs a properly formatted string for a time input as an integer """
-            if input//100 < 10:
-                timestring = '0' + str(input//100)
-            else:
-                timestring = str(input//100)
-            if input%100 < 10:
-                timestring = timestring + ':' + '0' + str(input%100)
+        Builds one slot per minute of the day over the sorted image_file_list.
+        slot_start is the index of the first record at or after the minute,
+        slot_count the number of records for the minute and slot_next the
+        index of the first record of the next minute that has an image,
+        wrapping around midnight, or -1 if the catalog is empty.
+        """
+        records = self.image_file_list
+        total = len(records)
+        position = 0
+        for minute in range(0, MINUTES_PER_DAY):
+            clock4 = (minute // 60) * 100 + minute % 60
+            while position < total and records[position].clock4 < clock4:
+                position += 1
+            count = 0
+            while position + count < total and records[position + count].clock4 == clock4:
+                count += 1
+            self.slot_start[minute] = position
+            self.slot_count[minute] = count
+        # walk the day backwards to find the next minute with an image
+        following = -1
+        for minute in range(0, MINUTES_PER_DAY):
+            if self.slot_count[minute] > 0:
+                following = self.slot_start[minute]  # first image of the day for the wrap-around
+                break
+        for minute in range(MINUTES_PER_DAY - 1, -1, -1):
+            self.slot_next[minute] = following
+            if self.slot_count[minute] > 0:
+                following = self.slot_start[minute]
+
+    def minute_search(self, time4 :int):
+        """ This method is called externally.
+        Returns a 2 element list of the index of the first image matching the
+        4 digit time and the number of matching images. If no image matches,
+        the index is the next available image and the number is zero. """
+        minute = time4_to_minute(time4)
+        if self.slot_count[minute] > 0:
+            return [self.slot_start[minute], self.slot_count[minute]]
+        return [max(self.slot_next[minute], 0), 0]
+
+    def next_image(self, time4 :int):
+        """ This method is called externally.
+        Returns the index of the first image after the 4 digit time, or -1
+        if there are no images. """
+        return self.slot_next[time4_to_minute(time4)]
+
+    def catalog_position(self, clock4 :int, image_filepath :str):
+        """ Returns the index in the sorted image_file_list where a record
+        with the given time and path belongs, by binary search. """
+        low = 0
+        high = len(self.image_file_list)
+        key = (clock4, image_filepath)
+        while low < high:
+            middle = (low + high) // 2
+            record = self.image_file_list[middle]
+            if (record.clock4, record.image_filepath) < key:
+                low = middle + 1
             else:
-                timestring = timestring + ':' + str(input%100)
-            return timestring
-
-        def minute_search(hour: int):
-            """ returns a list of minutes that are not cataloged in image file list """
-            # Churn through all the minutes and all the files to find matches. Not efficient, but so what.
-            # NOTE: Consider optimizing loop entries and exits to reduce loops - more important with more compound loops.
-            missing_minutes_list = []
-            hour=hour*100
-            for minute in range(0, 60):
-                for obj in self.image_file_list:
-                    search_minute = hour + minute
-                    if obj.clock4 == search_minute:
-                        break # if a matching minute is found, then immediately break out of the first level loop.
-                    elif self.image_file_list.index(obj) != len(self.image_file_list) -1:
-                        continue
-                    else:
-                        missing_minutes_list.append(search_minute)
-                        # if a matching minute was not found, add it to the missing list.
-            return missing_minutes_list
+                high = middle
+        return low
 
-        """ end of function definitions for this method """
-        # run the search on a particular hour or loop over all hours
+    def add_file(self, file :str):
+        """ This method is called externally.
+        Catalogs a single new or changed file in place, keeping the
+        image_file_list sorted. Returns True if the catalog changed. """
+        if os.path.splitext(file)[1].lower() not in IMAGE_EXTENSIONS:
+            return False
+        self.remove_file(file, update_index=False)
+        new_record = self.tag_file(file)
+        if self.read_headers is True and new_record[0].clock4 >= 0:
+            self.set_image_size(new_record, self.image_header_size(file))
+        if new_record[0].clock4 >= 0 and new_record[0].valid is True:
+            for record in new_record:
+                self.image_file_list.insert(self.catalog_position(record.clock4, file), record)
+        else:
+            self.error_file_list.append(new_record[0])
+        self.build_slot_index()
+        if self.index is not None:
+            try:
+                self.queue_index_change(new_record, os.stat(file))
+                self.index.update(self.index_changes, [])
+            except (OSError, sqlite3.Error) as err:
+                print("Catalog index not updated for", file, err)
+            self.index_changes = list()
+        return True
+
+    def remove_file(self, file :str, update_index=True):
+        """ This method is called externally.
+        Removes the records of a single file in place. The times of the
+        records follow from the file name, so they are found by binary search.
+        Returns True if the catalog changed. """
+        changed = False
+        for record in self.tag_file(file):
+            if record.clock4 < 0:
+                continue
+            position = self.catalog_position(record.clock4, file)
+            if position < len(self.image_file_list) \
+            and self.image_file_list[position].image_filepath == file:
+                del self.image_file_list[position]
+                changed = True
+        for record in [r for r in self.error_file_list if r.image_filepath == file]:
+            self.error_file_list.remove(record)
+            changed = True
+        if changed:
+            self.build_slot_index()
+        if changed and update_index and self.index is not None:
+            try:
+                self.index.update([], [file])
+            except sqlite3.Error as err:
+                print("Catalog index not updated for", file, err)
+        return changed
+
+    def remove_directory(self, directory :str):
+        """ This method is called externally.
+        Removes the records of all files below a directory that was deleted
+        or moved away. Returns True if the catalog changed. """
+        prefix = os.path.join(directory, '')
+        removed = [r.image_filepath for r in self.image_file_list + self.error_file_list
+                   if r.image_filepath.startswith(prefix)]
+        if not removed:
+            return False
+        self.image_file_list = [r for r in self.image_file_list if not r.image_filepath.startswith(prefix)]
+        self.error_file_list = [r for r in self.error_file_list if not r.image_filepath.startswith(prefix)]
+        self.build_slot_index()
+        if self.index is not None:
+            try:
+                self.index.update([], set(removed))
+            except sqlite3.Error as err:
+                print("Catalog index not updated for", directory, err)
+        return True
+
+    def return_missing(self, hour=-1, output='text'):
+        """ This method is called externally.
+            Returns all the missing clocks as a string.  If the hour is defined
+            as 24, then then only from that particular hour. With output set
+            to 'json' the result is a JSON document instead of text.
+        """
         if hour == 24:
-            # loop through all hours and add to list
-            missing_minutes =[]
-            for hr in range(0,24):
-                missing_minutes.extend(minute_search(hr))
+            # all hours
+            first_minute, last_minute = 0, MINUTES_PER_DAY
         elif hour  >= 0 and  hour <= 23:
             # search for one hour
-            missing_minutes = minute_search(hour)
+            first_minute, last_minute = hour * 60, hour * 60 + 60
         else:
             # If an hour outside of the range of hours is specfied, then error.
             return -1
+        coverage = CoverageMap(self.slot_count)
+        if output == 'json':
+            return coverage.to_json(first_minute, last_minute)
+        return coverage.to_text(first_minute, last_minute, hour == 24)
 
-        # string operations
-        if hour == 24:
-            missing_minutes_string = '\nTotal clocks missing for all times: ' + str(len(missing_minutes)) + '\n\nRanges of missing clocks\n'
 
+class CoverageMap:
+    """
+    The minutes of the day that have at least one image, kept as a 1440 bit
+    integer bitmap with bit n set for minute n of the day. Gaps, runs and
+    counts are found with bitwise operations on the whole day at once instead
+    of searching the catalog for every minute.
+    """
+    FULL_DAY = (1 << MINUTES_PER_DAY) - 1
+
+    def __init__(self, slot_count):
+        """ slot_count is the number of images per minute of the day, as in
+        FileCatalog2.slot_count """
+        self.covered = 0
+        for minute in range(0, MINUTES_PER_DAY):
+            if slot_count[minute] > 0:
+                self.covered |= 1 << minute
+        self.missing = self.FULL_DAY & ~self.covered
+
+    @staticmethod
+    def range_mask(first_minute: int, last_minute: int):
+        """ bitmap of the minutes first_minute up to but excluding last_minute """
+        return ((1 << (last_minute - first_minute)) - 1) << first_minute
+
+    @staticmethod
+    def bit_positions(bitmap: int):
+        """ returns the positions of the set bits, lowest first """
+        positions = []
+        while bitmap:
+            low_bit = bitmap & -bitmap
+            positions.append(low_bit.bit_length() - 1)
+            bitmap ^= low_bit
+        return positions
+
+    @staticmethod
+    def minute_to_str(minute: int):
+        """ outputs a properly formatted HH:MM string for a minute of the day """
+        return '%02d:%02d' % (minute // 60, minute % 60)
+
+    def missing_minutes(self, first_minute=0, last_minute=MINUTES_PER_DAY):
+        """ minutes of the day without an image """
+        return self.bit_positions(self.missing & self.range_mask(first_minute, last_minute))
+
+    def gap_runs(self, first_minute=0, last_minute=MINUTES_PER_DAY):
+        """ list of (first, last) minute of each contiguous run of missing
+        minutes. Runs continue across hour boundaries. """
+        gaps = self.missing & self.range_mask(first_minute, last_minute)
+        # a run starts where the previous minute is covered and ends where the next is covered
+        starts = self.bit_positions(gaps & ~(gaps << 1))
+        ends = self.bit_positions(gaps & ~(gaps >> 1))
+        return list(zip(starts, ends))
+
+    def fivers(self, first_minute=0, last_minute=MINUTES_PER_DAY):
+        """ missing minutes on a multiple of five, good for analog clocks """
+        return [minute for minute in self.missing_minutes(first_minute, last_minute) if minute % 5 == 0]
+
+    def per_hour_counts(self):
+        """ list of the number of covered minutes of each hour """
+        hour_mask = self.range_mask(0, 60)
+        return [bin((self.covered >> (hour * 60)) & hour_mask).count('1') for hour in range(0, 24)]
+
+    def to_text(self, first_minute=0, last_minute=MINUTES_PER_DAY, all_hours=True):
+        """ the missing clocks report as printed by clock_main.py -m """
+        missing_total = len(self.missing_minutes(first_minute, last_minute))
+        if all_hours:
+            missing_minutes_string = '\nTotal clocks missing for all times: ' + str(missing_total) + '\n\nRanges of missing clocks\n'
         else:
-            missing_minutes_string = '\nTotal clocks missing this hour: ' + str(len(missing_minutes)) + '\n\nRanges of missing clocks\n'
-        run_start = 0
-        for ind in range(0, len(missing_minutes)):
-            # if the next indexed item is just one more integer than the
-            # current item, then there is a run, otherwise set the end of the
-            # run to the current index.
-            if ind != len(missing_minutes)-1:
-                if missing_minutes[ind]+1 == missing_minutes[ind+1]:
-                    run_end = ind+1
-                elif (missing_minutes[ind]-59)%100 == 0 and missing_minutes[ind+1]%100 == 0 \
-                    and (missing_minutes[ind]-59)//100+1 == missing_minutes[ind+1]//100:
-                    #check the bridge of the hour
-                    run_end = ind+1
-                else:
-                    run_end = ind
-            # if there is no run of a sequence, add that single time otherwise
-            if run_end==run_start:
-                timestring1 = time4_to_str(missing_minutes[ind])
-                missing_minutes_string = missing_minutes_string + timestring1 + '\n'
-                run_start = ind + 1
-            elif run_end == ind:
-                timestring1 = time4_to_str(missing_minutes[run_start])
-                timestring2 = time4_to_str(missing_minutes[run_end])
-                missing_minutes_string = missing_minutes_string + timestring1 + ' - ' + timestring2 + '\n'
-                run_start = ind + 1
+            missing_minutes_string = '\nTotal clocks missing this hour: ' + str(missing_total) + '\n\nRanges of missing clocks\n'
+        for run_start, run_end in self.gap_runs(first_minute, last_minute):
+            if run_start == run_end:
+                missing_minutes_string += self.minute_to_str(run_start) + '\n'
             else:
-                pass
+                missing_minutes_string += self.minute_to_str(run_start) + ' - ' + self.minute_to_str(run_end) + '\n'
         missing_minutes_string += "\nFivers (good for analog clocks) \n"
-        for ind in range(0, len(missing_minutes)):
-            if missing_minutes[ind]%5 == 0:
-                missing_minutes_string =  missing_minutes_string + time4_to_str(missing_minutes[ind]) +'\n'
+        for minute in self.fivers(first_minute, last_minute):
+            missing_minutes_string += self.minute_to_str(minute) + '\n'
         return missing_minutes_string
 
+    def to_json(self, first_minute=0, last_minute=MINUTES_PER_DAY):
+        """ the missing clocks report as a JSON document for inventory tools """
+        counts = self.per_hour_counts()
+        first_hour, last_hour = first_minute // 60, (last_minute - 1) // 60
+        return json.dumps({
+            'total_missing': len(self.missing_minutes(first_minute, last_minute)),
+            'ranges': [[self.minute_to_str(run_start), self.minute_to_str(run_end)]
+                       for run_start, run_end in self.gap_runs(first_minute, last_minute)],
+            'fivers': [self.minute_to_str(minute) for minute in self.fivers(first_minute, last_minute)],
+            'hours': {'%02d' % hour: {'covered': counts[hour], 'missing': 60 - counts[hour]}
+                      for hour in range(first_hour, last_hour + 1)}},
+            indent=2)
+
 
 """ end of class definitions
 Below is executed only when run directly from the command line. """
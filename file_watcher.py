@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Watches the image directory for changes so the catalog can be updated in place
+instead of a full rescan with SIGUSR1.
+
+USE:
+    watcher = start_watcher(IMAGE_PATH, callback)
+The callback is called from the watcher thread with an action and a path.
+Actions are:
+    'added'   - an image file was created, changed or moved in
+    'removed' - an image file was deleted or moved away
+    'removed_tree' - a directory was deleted or moved away
+    'rescan'  - events were lost and the whole catalog should be rescanned
+The callback should only queue the change. Apply it to the catalog in the
+thread that owns it.
+
+On Linux inotify is used through ctypes.  Everywhere else, or if inotify is
+not available, the directory tree is polled.
+
+TEST:
+just run this python file with a directory to watch and change files in it.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import platform
+import select
+import struct
+import threading
+import time
+
+from file_enumeration import IMAGE_EXTENSIONS
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+IN_NONBLOCK = 0o4000
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+             IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, len
+
+
+def is_image_file(pathname: str):
+    """ True if the file has one of the cataloged image extensions """
+    return os.path.splitext(pathname)[1].lower() in IMAGE_EXTENSIONS
+
+
+def directory_key(directory: str):
+    """ Returns the (st_dev, st_ino) pair that identifies a directory """
+    directory_stat = os.stat(directory)
+    return (directory_stat.st_dev, directory_stat.st_ino)
+
+
+def walk_once(top: str, follow_symlinks: bool, visited: set):
+    """ os.walk that does not descend into a directory whose key is already in
+    visited, so a symlink loop or a second link to a directory is walked only
+    once. The keys of the walked directories are added to visited. Without
+    following symlinks os.walk cannot loop and no keys are kept. """
+    if follow_symlinks:
+        top_key = directory_key(top)
+        if top_key in visited:
+            return
+        visited.add(top_key)
+    for dirpath, dirnames, filenames in os.walk(top, followlinks=follow_symlinks):
+        if follow_symlinks:
+            new_dirnames = []
+            for d in dirnames:
+                try:
+                    key = directory_key(os.path.join(dirpath, d))
+                except OSError:
+                    continue
+                if key not in visited:
+                    visited.add(key)
+                    new_dirnames.append(d)
+            # os.walk descends into what is left in dirnames
+            dirnames[:] = new_dirnames
+        yield dirpath, dirnames, filenames
+
+
+class PollingWatcher:
+    """
+    Fallback watcher that compares the size and modification time of the
+    image files in the tree every poll_seconds.
+    """
+    def __init__(self, top: str, callback, poll_seconds=10, follow_symlinks=True):
+        self.top = top
+        self.callback = callback
+        self.poll_seconds = poll_seconds
+        self.follow_symlinks = follow_symlinks
+        self.stop_event = threading.Event()
+        self.snapshot = self.take_snapshot()
+        self.thread = threading.Thread(target=self.run, name='PollingWatcher', daemon=True)
+
+    def take_snapshot(self):
+        """ returns a dictionary of image file paths to (size, mtime) """
+        snapshot = dict()
+        for dirpath, dirnames, filenames in walk_once(self.top, self.follow_symlinks, set()):
+            for f in filenames:
+                pathname = os.path.join(dirpath, f)
+                if is_image_file(pathname):
+                    try:
+                        file_stat = os.stat(pathname)
+                    except OSError:
+                        continue
+                    snapshot[pathname] = (file_stat.st_size, file_stat.st_mtime_ns)
+        return snapshot
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        while not self.stop_event.wait(self.poll_seconds):
+            snapshot = self.take_snapshot()
+            for pathname in self.snapshot.keys() - snapshot.keys():
+                self.callback('removed', pathname)
+            for pathname, entry in snapshot.items():
+                if self.snapshot.get(pathname) != entry:
+                    self.callback('added', pathname)
+            self.snapshot = snapshot
+
+
+class InotifyWatcher:
+    """
+    Watcher using the Linux inotify interface through ctypes. inotify is not
+    recursive, so every directory in the tree gets its own watch and new
+    directories are added as they appear.
+    """
+    def __init__(self, top: str, callback, follow_symlinks=True):
+        self.top = top
+        self.callback = callback
+        self.follow_symlinks = follow_symlinks
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.watches = dict()  # watch descriptor to directory path
+        self.watch_keys = dict()  # watch descriptor to directory key
+        self.stop_event = threading.Event()
+        try:
+            self.add_tree(top)
+        except Exception:
+            # closing the descriptor also removes the watches added so far
+            os.close(self.fd)
+            raise
+        self.thread = threading.Thread(target=self.run, name='InotifyWatcher', daemon=True)
+
+    def add_watch(self, directory: str):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed for " + directory)
+        self.watches[wd] = directory
+        if self.follow_symlinks:
+            self.watch_keys[wd] = directory_key(directory)
+
+    def add_tree(self, top: str, report=False):
+        """ watch a directory and everything below it. If report is set, the
+        image files already in it are reported as added, because they may have
+        been written before the watch existed. Directories that are already
+        watched are skipped. """
+        visited = set(self.watch_keys.values())
+        for dirpath, dirnames, filenames in walk_once(top, self.follow_symlinks, visited):
+            self.add_watch(dirpath)
+            if report:
+                for f in filenames:
+                    pathname = os.path.join(dirpath, f)
+                    if is_image_file(pathname):
+                        self.callback('added', pathname)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+
+    def run(self):
+        try:
+            while not self.stop_event.is_set():
+                readable, _, _ = select.select([self.fd], [], [], 1.0)
+                if readable:
+                    self.handle_events(os.read(self.fd, 64 * 1024))
+        finally:
+            os.close(self.fd)
+
+    def handle_events(self, buffer: bytes):
+        offset = 0
+        while offset < len(buffer):
+            wd, mask, cookie, length = EVENT_HEADER.unpack_from(buffer, offset)
+            name = buffer[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length]
+            offset += EVENT_HEADER.size + length
+            if mask & IN_Q_OVERFLOW:
+                self.callback('rescan', self.top)
+                continue
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                self.watch_keys.pop(wd, None)
+                continue
+            directory = self.watches.get(wd)
+            if directory is None or mask & IN_DELETE_SELF:
+                continue
+            pathname = os.path.join(directory, os.fsdecode(name.rstrip(b'\0')))
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    try:
+                        self.add_tree(pathname, report=True)
+                    except OSError as err:
+                        print("Not watching", pathname, err)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.callback('removed_tree', pathname)
+            elif is_image_file(pathname):
+                if mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                    self.callback('added', pathname)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.callback('removed', pathname)
+
+
+def start_watcher(top: str, callback, poll_seconds=10, follow_symlinks=True):
+    """ Starts and returns an inotify watcher if the platform supports it,
+    otherwise a polling watcher. """
+    if platform.system() == 'Linux':
+        try:
+            return InotifyWatcher(top, callback, follow_symlinks).start()
+        except (OSError, AttributeError) as err:
+            print("inotify not available, polling the image directory instead:", err)
+    return PollingWatcher(top, callback, poll_seconds, follow_symlinks).start()
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import sys
+    def print_change(action, pathname):
+        """simple test function to test the callback"""
+        print(action, pathname)
+    watcher = start_watcher(sys.argv[1] if len(sys.argv) > 1 else ".", print_change, 2)
+    print("Watching with", type(watcher).__name__, "Press Ctrl-C to exit.")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        watcher.stop()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+
+"""
+Shared fonts and rendered labels for the text of the clock.
+
+FontCache loads every font file once per size, so the modules of the clock
+share the Font objects instead of loading the same file again.
+
+A TextLabel keeps the last label it rendered and renders again only when the
+text changes. The date changes once a day and the next image text rarely, so
+of the labels of a minute usually only the time is rendered.
+
+Pre-rendering single glyphs and blitting them into labels was measured and is
+slower: SDL_ttf keeps its own cache of rendered glyphs, and a warm
+Font.render of a time label at 4K size takes less than the blits of the
+glyphs (run this file for the numbers).
+
+USE:
+    font = font_cache.get(FONTPATH, 100)   # '' for the default font
+    time_label = TextLabel(font, (128,0,0))
+    surface = time_label.render("12:34PM")
+
+TEST:
+just run this python file.
+"""
+
+import pygame
+
+
+class FontCache:
+    """ Fonts keyed by (file path, size). An empty path is the default font """
+    def __init__(self):
+        self.fonts = dict()
+
+    def get(self, font_filepath: str, size: int):
+        key = (font_filepath, size)
+        font = self.fonts.get(key)
+        if font is None:
+            if font_filepath:
+                font = pygame.font.Font(font_filepath, size)
+            else:
+                font = pygame.font.SysFont(pygame.font.get_default_font(), size)
+            self.fonts[key] = font
+        return font
+
+
+# the font cache shared by the clock modules
+font_cache = FontCache()
+
+
+class TextLabel:
+    """
+    Renders text with a font and color like Font.render without a background,
+    and returns the same surface again while the text does not change.
+    """
+    def __init__(self, font: pygame.font.Font, color: tuple, antialias=True):
+        self.font = font
+        self.color = color
+        self.antialias = antialias
+        self.text = None
+        self.surface = None
+        self.renders = 0
+
+    def render(self, text: str):
+        if text != self.text:
+            self.surface = self.font.render(text, self.antialias, self.color)
+            self.text = text
+            self.renders += 1
+        return self.surface
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import os
+    import time
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    pygame.display.set_mode((100, 100))
+    font = font_cache.get('', 216)  # the time font of a 4K display
+    assert font_cache.get('', 216) is font
+    repeats = 300
+    texts = ["%02d:%02dPM" % (minute // 60 % 12 + 1, minute % 60) for minute in range(repeats)]
+    font.render("0123456789:PM", True, (128, 0, 0))  # warm the glyph cache of SDL_ttf
+    start = time.perf_counter()
+    for text in texts:
+        font.render(text, True, (128, 0, 0))
+    render_ms = (time.perf_counter() - start) * 1000 / repeats
+    glyphs = {character: font.render(character, True, (128, 0, 0)) for character in "0123456789:PM"}
+    start = time.perf_counter()
+    for text in texts:
+        parts = [glyphs[character] for character in text]
+        label = pygame.Surface((sum(part.get_width() for part in parts), font.get_height()), pygame.SRCALPHA)
+        x = 0
+        for part in parts:
+            label.blit(part, (x, 0), special_flags=pygame.BLEND_RGBA_MAX)
+            x += part.get_width()
+    glyph_ms = (time.perf_counter() - start) * 1000 / repeats
+    print("time label at 216 px: Font.render %.3f ms, blitted glyphs %.3f ms" % (render_ms, glyph_ms))
+    date_label = TextLabel(font, (128, 0, 0))
+    for minute in range(1440):
+        date_label.render("October 16, 2026")
+    print("date label renders in a day of minutes:", date_label.renders)
+    pygame.quit()
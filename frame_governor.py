@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Frame rate governor for the game loop. The loop rate follows what is on
+screen instead of one global frame rate: the full rate while the analog second
+hand sweeps, a low rate while the text fades, and no ticking at all while a
+static image is shown (the loop waits for events instead).
+
+USE:
+    governor = FrameRateGovernor({1: 30, 3: 10, 4: 0, 8: 30}, default_rate=30)
+    while running:
+        ... draw the frame for the display state ...
+        governor.tick(state)
+    print(governor.report())
+
+A rate of 0 does not limit the loop, because the caller blocks elsewhere.
+The governor measures the effective frames per second of each state.
+
+TEST:
+just run this python file.
+"""
+
+import time
+
+import pygame
+
+
+class FrameRateGovernor:
+    """
+    Ticks a pygame Clock at the rate of the current display state and counts
+    the frames and time spent in each state.
+    """
+    def __init__(self, rates: dict, default_rate=30):
+        self.rates = rates
+        self.default_rate = default_rate
+        self.clock = pygame.time.Clock()
+        self.frames = dict()   # state to frames since the last report
+        self.seconds = dict()  # state to seconds since the last report
+        self.last_tick = time.perf_counter()
+
+    def rate(self, state: int):
+        """ The target frame rate of a display state """
+        return self.rates.get(state, self.default_rate)
+
+    def tick(self, state: int):
+        """ Waits until the next frame of the state is due and records the
+        frame. Returns the seconds since the previous tick. """
+        self.clock.tick(self.rate(state))
+        now = time.perf_counter()
+        frame_seconds = now - self.last_tick
+        self.last_tick = now
+        self.frames[state] = self.frames.get(state, 0) + 1
+        self.seconds[state] = self.seconds.get(state, 0.0) + frame_seconds
+        return frame_seconds
+
+    def report(self, reset=True):
+        """ Returns a dictionary of state to effective frames per second since
+        the last report. """
+        fps = {state: self.frames[state] / self.seconds[state]
+               for state in sorted(self.frames) if self.seconds[state] > 0}
+        if reset is True:
+            self.frames.clear()
+            self.seconds.clear()
+        return fps
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    governor = FrameRateGovernor({1: 30, 2: 10}, default_rate=60)
+    for state in (1, 2, 3):
+        for frame in range(30):
+            governor.tick(state)
+    print("effective fps by state:", {state: round(fps, 1) for state, fps in governor.report().items()})
@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+
+"""
+A heads-up display of the frame timing, drawn over the clock to see on the
+display itself when a minute change or a fade hitches. It shows the effective
+frames per second, the worst frame of the last minute, a histogram of the
+frame times of the last minute, the blits of the last frame and the pixel area
+pushed to the display.
+
+USE:
+The HUD is the top layer of a SceneCompositor, see scene_compositor.py:
+    hud = FrameHUD((0, 0), pygame.font.SysFont(None, 20))
+    scene = SceneCompositor(screen, [..., hud])
+    while running:
+        pygame.display.update(scene.compose())
+        if hud.enabled is True:
+            hud.record(work_seconds, blits, analog_blits, dirty_area, clock.get_fps())
+        ... on a key press: hud.toggle()
+
+The HUD only records and draws while it is enabled, so it costs one attribute
+check per frame when it is off. It draws an opaque panel in its own rect,
+which is dirty every frame while it is enabled. When it is turned off the
+rect is dirty once more, so the layers below are drawn there again.
+
+The frame time is the work of a frame, from its start until the events are
+handled, including the display update, without the idle wait for events and
+the wait for the next frame. The waits would otherwise hide every hitch.
+
+TEST:
+just run this python file.
+"""
+
+from bisect import bisect_left
+from collections import deque
+import time
+
+import pygame
+
+WINDOW_SECONDS = 60 # frames of the worst frame time and the histogram
+HISTOGRAM_EDGES_MS = (4, 8, 16, 33, 50, 100, 250) # upper bucket edges. The last bucket is open
+HISTOGRAM_HEIGHT = 40 # pixels of the tallest histogram bar
+PANEL_COLOR = (0, 0, 0)
+TEXT_COLOR = (0, 255, 0)
+BAR_COLOR = (0, 160, 0)
+SLOW_BAR_COLOR = (255, 64, 0) # buckets slower than the frame budget of 30 fps
+
+
+class FrameHUD:
+    """
+    Records the frame times of a rolling window and draws them with the other
+    frame counters in an opaque panel at position.
+    """
+    def __init__(self, position: tuple, font: pygame.font.Font, window_seconds=WINDOW_SECONDS):
+        self.font = font
+        self.window_seconds = window_seconds
+        self.enabled = False
+        self.cleared = False # turned off, but the rect was not drawn over yet
+        self.frames = deque() # (monotonic time, frame seconds) of the window
+        self.worst = deque()  # decreasing frame seconds of the window, worst first
+        self.bucket_counts = [0] * (len(HISTOGRAM_EDGES_MS) + 1)
+        self.last_blits = 0
+        self.last_analog_blits = 0
+        self.last_dirty_area = 0
+        self.fps = 0.0
+        # the panel with the histogram labels is rendered once
+        line_height = font.get_linesize()
+        labels = ["<%d" % edge for edge in HISTOGRAM_EDGES_MS] + ["%d+" % HISTOGRAM_EDGES_MS[-1]]
+        self.bar_width = max(font.size(label)[0] for label in labels) + 4
+        width = max(self.bar_width * len(labels), font.size("dirty area 00000000 px")[0]) + 8
+        self.histogram_bottom = 4 + 4 * line_height + HISTOGRAM_HEIGHT
+        self.rect = pygame.Rect(position, (width, self.histogram_bottom + line_height + 4))
+        self.panelSurface = pygame.Surface(self.rect.size)
+        self.panelSurface.fill(PANEL_COLOR)
+        for index, label in enumerate(labels):
+            self.panelSurface.blit(font.render(label, True, TEXT_COLOR),
+                                   (4 + index * self.bar_width, self.histogram_bottom + 2))
+        self.slow_bucket = bisect_left(HISTOGRAM_EDGES_MS, 1000 // 30)
+
+    @property
+    def visible(self):
+        """ True while draw() has something to draw """
+        return self.enabled is True or self.cleared is True
+
+    def toggle(self):
+        """ Turns the HUD on or off. The window starts empty when it is turned
+        on. Returns whether it is enabled. """
+        self.enabled = not self.enabled
+        self.cleared = not self.enabled
+        self.frames.clear()
+        self.worst.clear()
+        self.bucket_counts = [0] * len(self.bucket_counts)
+        return self.enabled
+
+    def record(self, frame_seconds: float, blits: int, analog_blits: int, dirty_area: int, fps=0.0, now=None):
+        """ Records a frame and the effective frame rate. The oldest frames
+        leave the window. """
+        if now is None:
+            now = time.monotonic()
+        self.frames.append((now, frame_seconds))
+        self.bucket_counts[bisect_left(HISTOGRAM_EDGES_MS, frame_seconds * 1000)] += 1
+        while self.worst and self.worst[-1][1] <= frame_seconds:
+            self.worst.pop()
+        self.worst.append((now, frame_seconds))
+        window_start = now - self.window_seconds
+        while self.frames[0][0] < window_start:
+            old_seconds = self.frames.popleft()[1]
+            self.bucket_counts[bisect_left(HISTOGRAM_EDGES_MS, old_seconds * 1000)] -= 1
+        while self.worst[0][0] < window_start:
+            self.worst.popleft()
+        self.last_blits = blits
+        self.last_analog_blits = analog_blits
+        self.last_dirty_area = dirty_area
+        self.fps = fps
+
+    def worst_frame_seconds(self):
+        """ The longest frame time of the window, 0 if it is empty """
+        return self.worst[0][1] if self.worst else 0.0
+
+    def dirty_rects(self):
+        """ The HUD rect while it is shown and once after it is turned off """
+        return [self.rect] if self.visible is True else []
+
+    def draw(self, surface: pygame.Surface, rect: pygame.Rect):
+        """ Draws the HUD to the surface if it is enabled. Returns the number
+        of blits. """
+        if self.enabled is False:
+            return 0
+        surface.blit(self.panelSurface, self.rect)
+        lines = ("fps %.1f" % self.fps,
+                 "worst %.1f ms in %d s" % (self.worst_frame_seconds() * 1000, self.window_seconds),
+                 "blits %d analog %d" % (self.last_blits, self.last_analog_blits),
+                 "dirty area %d px" % self.last_dirty_area)
+        line_height = self.font.get_linesize()
+        for index, line in enumerate(lines):
+            surface.blit(self.font.render(line, True, TEXT_COLOR),
+                         (self.rect.x + 4, self.rect.y + 4 + index * line_height))
+        most = max(self.bucket_counts)
+        if most > 0:
+            for index, count in enumerate(self.bucket_counts):
+                height = count * HISTOGRAM_HEIGHT // most
+                if height > 0:
+                    surface.fill(SLOW_BAR_COLOR if index > self.slow_bucket else BAR_COLOR,
+                                 (self.rect.x + 4 + index * self.bar_width,
+                                  self.rect.y + self.histogram_bottom - height,
+                                  self.bar_width - 2, height))
+        return 1 + len(lines)
+
+    def composited(self):
+        self.cleared = False
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import os
+    import random
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((400, 300))
+    hud = FrameHUD((0, 0), pygame.font.SysFont(None, 20), window_seconds=10)
+    hud.toggle()
+    for frame in range(300):
+        hud.record(random.expovariate(1 / 0.012), 5, 3, 400 * 300, 30.0, now=frame / 30)
+    print("frames in window:", len(hud.frames), "histogram:", hud.bucket_counts,
+          "worst: %.1f ms" % (hud.worst_frame_seconds() * 1000))
+    print("hud rect:", hud.dirty_rects(), "blits:", hud.draw(screen, hud.rect))
+    hud.composited()
+    hud.toggle()
+    print("rect to clear after off:", hud.dirty_rects(), "blits:", hud.draw(screen, hud.rect))
+    hud.composited()
+    print("then:", hud.dirty_rects())
+    pygame.quit()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Frame cost statistics of the game loop by display state, for the
+--stats-json option of clock_main.py and benchmark_render.py.
+
+For every frame the loop records the display state, the time spent drawing
+(work), the whole frame period including the wait for the next frame, the
+processor time of the process from getrusage and the number of blits.
+
+USE:
+    stats = FrameStats()
+    while running:
+        start = time.perf_counter()
+        ... draw ...
+        work = time.perf_counter() - start
+        ... wait for the next frame ...
+        stats.record(state, work, time.perf_counter() - start, blits)
+    json.dump(stats.summary(STATE_NAMES), f)
+
+The samples are kept in memory, so use it for benchmark runs, not for a clock
+running for days.
+"""
+
+import time
+from array import array
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+
+def cpu_seconds():
+    """ user and system processor time of this process """
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return usage.ru_utime + usage.ru_stime
+    return time.process_time()
+
+
+def percentile(ordered, fraction: float):
+    """ The value at fraction (0 to 1) of an ordered sequence """
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def duration_summary(durations):
+    """ Returns a text of the count and the mean, median, 95th percentile and
+    maximum in milliseconds of a list of durations in seconds. """
+    if not durations:
+        return "none"
+    ordered = sorted(durations)
+    return "%d, mean %.1f ms, p50 %.1f ms, p95 %.1f ms, max %.1f ms" % (len(ordered),
+        1000 * sum(ordered) / len(ordered), 1000 * percentile(ordered, .5),
+        1000 * percentile(ordered, .95), 1000 * ordered[-1])
+
+
+class StateStats:
+    """ The frames of one display state """
+    __slots__ = ('work', 'period_seconds', 'cpu_seconds', 'blits')
+
+    def __init__(self):
+        self.work = array('d')  # seconds of drawing per frame
+        self.period_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.blits = 0
+
+
+class FrameStats:
+    """ Collects the cost of each frame by display state """
+    def __init__(self):
+        self.states = dict()
+        self.last_cpu = cpu_seconds()
+
+    def record(self, state: int, work_seconds: float, period_seconds: float, blits: int):
+        """ Records a frame. The processor time is the time used since the
+        previous record. """
+        cpu = cpu_seconds()
+        state_stats = self.states.get(state)
+        if state_stats is None:
+            state_stats = self.states[state] = StateStats()
+        state_stats.work.append(work_seconds)
+        state_stats.period_seconds += period_seconds
+        state_stats.cpu_seconds += cpu - self.last_cpu
+        state_stats.blits += blits
+        self.last_cpu = cpu
+
+    def summary(self, state_names=None):
+        """ Returns a dictionary of state number to the frame statistics of
+        the state, times in milliseconds. """
+        summary = dict()
+        for state in sorted(self.states):
+            state_stats = self.states[state]
+            frames = len(state_stats.work)
+            ordered = sorted(state_stats.work)
+            period = state_stats.period_seconds
+            summary[state] = {
+                'name': (state_names or {}).get(state, str(state)),
+                'frames': frames,
+                'fps': frames / period if period > 0 else 0.0,
+                'work_mean_ms': 1000 * sum(ordered) / frames,
+                'work_p50_ms': 1000 * percentile(ordered, .5),
+                'work_p95_ms': 1000 * percentile(ordered, .95),
+                'work_p99_ms': 1000 * percentile(ordered, .99),
+                'work_max_ms': 1000 * ordered[-1],
+                'cpu_ms_per_frame': 1000 * state_stats.cpu_seconds / frames,
+                'cpu_percent': 100 * state_stats.cpu_seconds / period if period > 0 else 0.0,
+                'blits_per_frame': state_stats.blits / frames}
+        return summary
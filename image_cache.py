@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Caches of images that are already scaled to the display size.
+
+SurfaceCache keeps recently shown images in memory within a byte budget, so
+a reset of the game loop or a rescan of the image directory reuses the
+surfaces instead of loading them again. Like the disk cache it is keyed by the
+source modification time and size, so an image replaced in place is loaded
+again.
+
+ScaledImageCache keeps the scaled pixels on disk as raw RGB buffers, so an
+image that was shown before is loaded with a memory-mapped read instead of
+decoding the full resolution photo again. Entries are keyed by the source
+path, modification time, size and the target size, so a changed source file
+or a new window size simply misses the cache. The least recently used entries
+are deleted when the cache grows over its size budget.
+"""
+
+import hashlib
+import mmap
+import os
+import struct
+import threading
+from collections import OrderedDict
+
+import pygame
+
+
+class SurfaceCache:
+    """
+    An in-memory least recently used cache of scaled surfaces keyed by image
+    path, modification time, size and target size, limited by the bytes of
+    pixel data it holds.
+    The cached surfaces are shared and must not be drawn on.
+    """
+    def __init__(self, budget_bytes: int):
+        self.budget_bytes = budget_bytes
+        self.surfaces = OrderedDict()
+        self.total_bytes = 0
+        # the prefetch worker and the game loop both use the cache
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def surface_bytes(surface: pygame.Surface):
+        return surface.get_pitch() * surface.get_height()
+
+    @staticmethod
+    def cache_key(image_filepath: str, size: tuple):
+        """ Returns the key of an image at a target size. Raises OSError if
+        the source image does not exist. """
+        source_stat = os.stat(image_filepath)
+        return (image_filepath, source_stat.st_mtime_ns, source_stat.st_size, tuple(size))
+
+    def get(self, image_filepath: str, size: tuple):
+        """ Returns the cached surface or None """
+        try:
+            key = self.cache_key(image_filepath, size)
+        except OSError:
+            self.misses += 1
+            return None
+        with self.lock:
+            surface = self.surfaces.get(key)
+            if surface is None:
+                self.misses += 1
+                return None
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+    def put(self, image_filepath: str, size: tuple, surface: pygame.Surface):
+        """ Adds a surface and evicts the least recently used surfaces until
+        the cache is within its budget. A surface larger than the whole budget
+        is not cached. """
+        try:
+            key = self.cache_key(image_filepath, size)
+        except OSError:
+            return
+        surface_bytes = self.surface_bytes(surface)
+        if surface_bytes > self.budget_bytes:
+            return
+        with self.lock:
+            previous = self.surfaces.pop(key, None)
+            if previous is not None:
+                self.total_bytes -= self.surface_bytes(previous)
+            self.surfaces[key] = surface
+            self.total_bytes += surface_bytes
+            while self.total_bytes > self.budget_bytes:
+                evicted_key, evicted = self.surfaces.popitem(last=False)
+                self.total_bytes -= self.surface_bytes(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.surfaces.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        """ Returns the cache counters as a dictionary """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.surfaces), 'bytes': self.total_bytes}
+
+
+class ScaledImageCache:
+    """
+    A persistent cache of scaled images in a directory. The files hold a
+    small header followed by the RGB pixels. The modification time of a cache
+    file is its last use and is the order of eviction.
+    """
+    HEADER = struct.Struct('<4sII')  # magic, width, height
+    MAGIC = b'ICS1'
+    EXTENSION = '.rgb'
+
+    def __init__(self, cache_dir: str, budget_bytes: int):
+        self.cache_dir = cache_dir
+        self.budget_bytes = budget_bytes
+        self.eviction_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def cache_filepath(self, image_filepath: str, size: tuple):
+        """ Returns the cache file for an image at a target size. Raises
+        OSError if the source image does not exist. """
+        source_stat = os.stat(image_filepath)
+        key = '%s\0%d\0%d\0%dx%d' % (image_filepath, source_stat.st_mtime_ns,
+                                     source_stat.st_size, size[0], size[1])
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode()).hexdigest() + self.EXTENSION)
+
+    def load(self, image_filepath: str, size: tuple):
+        """ Returns the cached image as a Surface in the display format, or
+        None if it is not cached. """
+        try:
+            cache_filepath = self.cache_filepath(image_filepath, size)
+            with open(cache_filepath, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    magic, width, height = self.HEADER.unpack_from(mapped)
+                    if magic != self.MAGIC or (width, height) != tuple(size) \
+                    or len(mapped) != self.HEADER.size + width * height * 3:
+                        raise ValueError("damaged cache file")
+                    with memoryview(mapped)[self.HEADER.size:] as pixels:
+                        mapped_surface = pygame.image.frombuffer(pixels, (width, height), 'RGB')
+                        # copy out of the mapping before it is closed
+                        if pygame.display.get_surface() is not None:
+                            surface = mapped_surface.convert()
+                        else:
+                            surface = mapped_surface.copy()
+                        del mapped_surface
+            os.utime(cache_filepath)
+        except (OSError, ValueError, struct.error):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return surface
+
+    def contains(self, image_filepath: str, size: tuple):
+        """ True if the image is cached at size. Does not mark it used. """
+        try:
+            return os.path.isfile(self.cache_filepath(image_filepath, size))
+        except OSError:
+            return False
+
+    def store(self, image_filepath: str, size: tuple, surface: pygame.Surface, evict=True):
+        """ Writes a scaled image to the cache and evicts the least recently
+        used entries if the cache is over budget. Batch writers can pass
+        evict=False and call evict() once at the end. """
+        temp_filepath = None
+        try:
+            cache_filepath = self.cache_filepath(image_filepath, size)
+            temp_filepath = cache_filepath + '.%d.tmp' % threading.get_ident()
+            with open(temp_filepath, 'wb') as f:
+                f.write(self.HEADER.pack(self.MAGIC, size[0], size[1]))
+                f.write(pygame.image.tostring(surface, 'RGB'))
+            # replace atomically so a reader never sees a partial file
+            os.replace(temp_filepath, cache_filepath)
+        except OSError as err:
+            print("Scaled image not cached for", image_filepath, err)
+            # evict() only counts cache files, so a partial file would stay
+            # behind on a full disk
+            if temp_filepath is not None and os.path.exists(temp_filepath):
+                try:
+                    os.remove(temp_filepath)
+                except OSError:
+                    pass
+            return
+        if evict is True:
+            self.evict()
+
+    def evict(self):
+        """ Deletes the least recently used cache files until the cache is
+        within its budget. """
+        with self.eviction_lock:
+            entries = []
+            total = 0
+            with os.scandir(self.cache_dir) as scan:
+                for entry in scan:
+                    if entry.name.endswith(self.EXTENSION):
+                        entry_stat = entry.stat()
+                        entries.append((entry_stat.st_mtime_ns, entry_stat.st_size, entry.path))
+                        total += entry_stat.st_size
+            if total <= self.budget_bytes:
+                return
+            entries.sort()
+            for mtime, file_size, path in entries:
+                if total <= self.budget_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= file_size
+                self.evictions += 1
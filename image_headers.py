@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Reads the dimensions of PNG, JPEG, GIF and BMP images from the file headers
+without decoding any pixels. Used by file_enumeration.py to find broken image
+files while cataloging instead of in the game loop.
+
+The format is found from the file contents, not the extension.
+
+TEST:
+just run this python file with image files as arguments.
+"""
+
+import struct
+
+# JPEG start of frame markers hold the image size. C4, C8 and CC are not frames.
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+                    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+# JPEG markers that have no length field
+JPEG_STANDALONE_MARKERS = {0x01, 0xD0, 0xD1, 0xD2, 0xD3, 0xD4, 0xD5, 0xD6, 0xD7}
+
+
+def png_size(f, head: bytes):
+    if len(head) < 24 or head[12:16] != b'IHDR':
+        raise ValueError("PNG without IHDR chunk")
+    return struct.unpack('>II', head[16:24])
+
+
+def gif_size(f, head: bytes):
+    if len(head) < 10:
+        raise ValueError("truncated GIF header")
+    return struct.unpack('<HH', head[6:10])
+
+
+def bmp_size(f, head: bytes):
+    if len(head) < 26:
+        raise ValueError("truncated BMP header")
+    dib_header_size = struct.unpack('<I', head[14:18])[0]
+    if dib_header_size == 12:
+        # OS/2 BITMAPCOREHEADER
+        width, height = struct.unpack('<HH', head[18:22])
+    else:
+        width, height = struct.unpack('<ii', head[18:26])
+    # a negative height is a top-down bitmap
+    return width, abs(height)
+
+
+def jpeg_size(f, head: bytes):
+    """ walks the JPEG segments up to the first start of frame marker """
+    f.seek(2)
+    while True:
+        byte = f.read(1)
+        if not byte:
+            raise ValueError("JPEG without a start of frame")
+        if byte != b'\xff':
+            continue
+        marker = f.read(1)
+        while marker == b'\xff':
+            # fill bytes before a marker
+            marker = f.read(1)
+        if not marker:
+            raise ValueError("JPEG without a start of frame")
+        marker = marker[0]
+        if marker in JPEG_STANDALONE_MARKERS:
+            continue
+        if marker == 0xD9 or marker == 0xDA:
+            # end of image or start of scan before any frame header
+            raise ValueError("JPEG without a start of frame")
+        segment = f.read(2)
+        if len(segment) < 2:
+            raise ValueError("truncated JPEG segment")
+        length = struct.unpack('>H', segment)[0]
+        if marker in JPEG_SOF_MARKERS:
+            frame = f.read(5)
+            if len(frame) < 5:
+                raise ValueError("truncated JPEG frame header")
+            height, width = struct.unpack('>HH', frame[1:5])
+            return width, height
+        f.seek(length - 2, 1)
+
+
+# file signatures and the function reading the size of each format
+IMAGE_SIGNATURES = [(b'\x89PNG\r\n\x1a\n', png_size),
+                    (b'\xff\xd8', jpeg_size),
+                    (b'GIF87a', gif_size),
+                    (b'GIF89a', gif_size),
+                    (b'BM', bmp_size)]
+
+
+def read_image_size(image_filepath: str):
+    """
+    Returns a (width, height) tuple read from the header of an image file.
+    Raises ValueError if the file is not a supported image or the header is
+    damaged, and OSError if the file can not be read.
+    """
+    with open(image_filepath, 'rb') as f:
+        head = f.read(32)
+        for signature, size_function in IMAGE_SIGNATURES:
+            if head.startswith(signature):
+                width, height = size_function(f, head)
+                if width <= 0 or height <= 0:
+                    raise ValueError("image with no pixels")
+                return width, height
+    raise ValueError("unknown image format")
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import sys
+    for image_filepath in sys.argv[1:]:
+        try:
+            print(image_filepath, read_image_size(image_filepath))
+        except (OSError, ValueError) as err:
+            print(image_filepath, "invalid:", err)
@@ -0,0 +1,208 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Loads and scales the clock images for display. The ImagePrefetcher loads the
+image of the next minute in a worker thread during the current minute, so
+the minute change in the game loop only needs a blit.
+
+The ImageLoader looks in the in-memory and the on-disk caches of scaled
+images before decoding an image and stores what it decodes.
+
+USE:
+    loader = ImageLoader(ScaledImageCache(cache_dir, budget_bytes),
+                         SurfaceCache(budget_bytes))
+    prefetcher = ImagePrefetcher(loader.load)
+    prefetcher.request(next_image_filepath, size)   # during the minute
+    surface = prefetcher.take(image_filepath, size)  # at the minute change
+    if surface is None:
+        surface = loader.load(image_filepath, size)
+
+A display mode must be set before images are loaded, because they are
+converted to the display pixel format.
+
+prescale_worker_init and prescale_image fill the scaled image cache from a
+process pool, see --prescale in clock_main.py.
+
+If Pillow is installed, JPEG files are decoded in draft mode, where the
+decoder scales the DCT blocks by 1/2, 1/4 or 1/8 to the smallest size that is
+still at least the display size. A 40 megapixel photo is then never expanded
+to full resolution in memory. Other formats and systems without Pillow use
+the pygame loader.
+"""
+
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pygame
+
+from image_cache import ScaledImageCache
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# values of the decoder setting
+DECODERS = ('auto', 'pillow', 'pygame')
+
+
+def pillow_available():
+    return Image is not None
+
+
+def decode_draft_jpeg(image_filepath: str, size: tuple):
+    """ Decodes a JPEG with Pillow at a reduced resolution no smaller than
+    size. Returns a Surface, or None if the file is not a JPEG. """
+    with Image.open(image_filepath) as image:
+        if image.format != 'JPEG':
+            return None
+        image.draft('RGB', tuple(size))
+        image = image.convert('RGB')
+        return pygame.image.frombuffer(image.tobytes(), image.size, 'RGB')
+
+
+def decode_image(image_filepath: str, size: tuple, decoder='auto'):
+    """ Decodes an image with the chosen decoder, near size if the decoder
+    can scale while decoding. In auto mode the images Pillow fails to decode
+    are loaded with pygame. """
+    if decoder != 'pygame' and Image is not None:
+        try:
+            surface = decode_draft_jpeg(image_filepath, size)
+        except (OSError, ValueError, SyntaxError):
+            # UnidentifiedImageError and truncated files are OSErrors
+            if decoder != 'auto':
+                raise
+            surface = None
+        if surface is not None:
+            return surface
+    return pygame.image.load(image_filepath)
+
+
+def load_scaled_image(image_filepath: str, size: tuple, decoder='auto'):
+    """ Loads an image, converts it to the display pixel format and scales it
+    to size. This is processor intensive for large photos. """
+    surface = decode_image(image_filepath, size, decoder)
+    surface = surface.convert()
+    return pygame.transform.smoothscale(surface, size)
+
+
+class ImageLoader:
+    """
+    Loads scaled images through an optional SurfaceCache in memory and an
+    optional ScaledImageCache on disk. It is safe to use from the prefetch
+    worker and the game loop at the same time.
+    """
+    def __init__(self, disk_cache=None, surface_cache=None, decoder='auto'):
+        self.disk_cache = disk_cache
+        self.surface_cache = surface_cache
+        self.decoder = decoder
+
+    def load(self, image_filepath: str, size: tuple):
+        """ Returns the image scaled to size in the display format """
+        if self.surface_cache is not None:
+            surface = self.surface_cache.get(image_filepath, size)
+            if surface is not None:
+                return surface
+        surface = None
+        if self.disk_cache is not None:
+            surface = self.disk_cache.load(image_filepath, size)
+        if surface is None:
+            surface = load_scaled_image(image_filepath, size, self.decoder)
+            if self.disk_cache is not None:
+                self.disk_cache.store(image_filepath, size, surface)
+        if self.surface_cache is not None:
+            self.surface_cache.put(image_filepath, size, surface)
+        return surface
+
+
+# the cache of a prescale worker process, set by prescale_worker_init
+prescale_cache = None
+prescale_decoder = 'auto'
+
+
+def prescale_worker_init(cache_dir: str, budget_bytes: int, decoder='auto'):
+    """ Initializes a prescale worker process with a hidden display, so
+    images can be converted, and its own handle of the scaled image cache. """
+    global prescale_cache, prescale_decoder
+    pygame.display.quit()
+    os.environ['SDL_VIDEODRIVER'] = 'dummy'
+    pygame.display.init()
+    pygame.display.set_mode((1, 1))
+    prescale_cache = ScaledImageCache(cache_dir, budget_bytes)
+    prescale_decoder = decoder
+
+
+def prescale_image(image_filepath: str, size: tuple):
+    """ Scales one image into the cache in a worker process. Returns
+    'cached' if it was already cached, 'scaled' or an error message. """
+    if prescale_cache.contains(image_filepath, size):
+        return 'cached'
+    try:
+        surface = load_scaled_image(image_filepath, size, prescale_decoder)
+    except (pygame.error, OSError, ValueError) as err:
+        return str(err) or type(err).__name__
+    prescale_cache.store(image_filepath, size, surface, evict=False)
+    return 'scaled'
+
+
+class ImagePrefetcher:
+    """
+    Loads one image ahead in a worker thread with the load function, by
+    default load_scaled_image. Only the latest request is kept. take() never
+    waits for the worker, so a prefetch that is not ready or failed is a miss
+    and the caller loads the image itself.
+    """
+    def __init__(self, load_function=load_scaled_image):
+        self.load_function = load_function
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ImagePrefetcher')
+        self.pending_key = None
+        self.pending_future = None
+        self.hits = 0
+        self.misses = 0
+
+    def request(self, image_filepath: str, size: tuple):
+        """ Starts loading an image in the background unless it is already
+        requested. """
+        key = (image_filepath, tuple(size))
+        if key == self.pending_key:
+            return
+        if self.pending_future is not None:
+            self.pending_future.cancel()
+        self.pending_key = key
+        self.pending_future = self.executor.submit(self.load_function, image_filepath, key[1])
+
+    def take(self, image_filepath: str, size: tuple):
+        """ Returns the prefetched surface if it matches the image and size
+        and is ready, otherwise None. """
+        key = (image_filepath, tuple(size))
+        future = self.pending_future
+        if key != self.pending_key or future is None or not future.done() \
+        or future.cancelled() or future.exception() is not None:
+            self.misses += 1
+            return None
+        self.pending_key = None
+        self.pending_future = None
+        self.hits += 1
+        return future.result()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+
+"""
+An optional HTTP server that exports the render and catalog statistics of the
+clock in the Prometheus text format, for fleet monitoring. It listens on
+localhost or on a Unix socket and serves GET /metrics.
+
+USE:
+    metrics = ClockMetrics(STATE_NAMES)
+    metrics.cache_sources = {'memory': surface_cache, 'prefetch': prefetcher}
+    metrics.catalog = catalog_snapshot(file_cat)   # again when it changes
+    server = MetricsServer(metrics, '127.0.0.1', 9180)  # or socket_path=...
+    server.start()
+    while running:
+        ... draw the frame ...
+        metrics.record_frame(state, work_seconds, 1 / frame_rate)
+    server.shutdown()
+
+The render loop never waits for the server. Every counter has one writing
+thread, the game loop or the prefetch worker, and the server thread only
+reads them. Reading a counter while it is written gives the value before or
+after the frame, which is all a scrape needs. The catalog statistics are
+computed by the game loop when the catalog changes and replaced as a whole.
+
+TEST:
+just run this python file. It serves made up statistics over TCP and a Unix
+socket and reads them back with a local HTTP client.
+"""
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+
+try:
+    import resource
+except ImportError:
+    # not on Windows
+    resource = None
+
+FRAME_BUCKETS = (.004, .008, .016, .033, .05, .1, .25, .5, 1.0) # seconds of the frame time histograms
+LOAD_BUCKETS = (.01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0) # seconds of the image load histograms
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def memory_bytes():
+    """ Returns the resident and the peak resident memory of this process in
+    bytes. The resident memory is None where /proc is not available. """
+    resident = peak = None
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    resident = int(line.split()[1]) * 1024
+                elif line.startswith('VmHWM:'):
+                    peak = int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    if peak is None and resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform != 'darwin':
+            peak *= 1024  # kilobytes except on macOS
+    return resident, peak
+
+
+def catalog_snapshot(catalog):
+    """ The statistics of a FileCatalog2. Run it in the thread that owns the
+    catalog. """
+    missing = json.loads(catalog.return_missing(24, 'json'))
+    return {'images': len(catalog.image_file_list),
+            'error_files': len(catalog.error_file_list),
+            'missing_minutes': missing['total_missing'],
+            'missing_minutes_by_hour': {hour: counts['missing'] for hour, counts in missing['hours'].items()}}
+
+
+class Histogram:
+    """ A histogram with fixed bucket edges written by one thread """
+    __slots__ = ('edges', 'counts', 'sum')
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = [0] * (len(edges) + 1)  # the last bucket is above the last edge
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.edges, value)] += 1
+        self.sum += value
+
+    def write(self, lines: list, name: str, labels: str):
+        """ Appends the cumulative buckets, the sum and the count in the text
+        format. labels is the label text without braces, or empty. """
+        counts = list(self.counts)
+        separator = ',' if labels else ''
+        cumulative = 0
+        for edge, count in zip(self.edges, counts):
+            cumulative += count
+            lines.append('%s_bucket{%s%sle="%g"} %d' % (name, labels, separator, edge, cumulative))
+        cumulative += counts[-1]
+        lines.append('%s_bucket{%s%sle="+Inf"} %d' % (name, labels, separator, cumulative))
+        braced = '{%s}' % labels if labels else ''
+        lines.append('%s_sum%s %g' % (name, braced, self.sum))
+        lines.append('%s_count%s %d' % (name, braced, cumulative))
+
+
+class ClockMetrics:
+    """
+    The statistics of a running clock. The game loop writes the frame
+    statistics and the catalog snapshot, the prefetch worker the prefetch
+    load times. Every histogram and counter of every display state exists
+    from the start, so the server never sees a dictionary change size.
+    """
+    def __init__(self, state_names: dict):
+        self.state_names = state_names
+        self.frame_seconds = {state: Histogram(FRAME_BUCKETS) for state in state_names}
+        self.missed_deadlines = {state: 0 for state in state_names}
+        self.image_load_seconds = {'loop': Histogram(LOAD_BUCKETS), 'prefetch': Histogram(LOAD_BUCKETS)}
+        self.cache_sources = {}  # name to an object with hits, misses and optional evictions
+        self.catalog = {}
+
+    def record_frame(self, state: int, work_seconds: float, deadline_seconds: float):
+        """ Records the work of a frame. It missed its deadline if it took
+        longer than deadline_seconds. 0 is no deadline. """
+        self.frame_seconds[state].observe(work_seconds)
+        if 0 < deadline_seconds < work_seconds:
+            self.missed_deadlines[state] += 1
+
+    def record_image_load(self, source: str, seconds: float):
+        """ Records an image load of the game loop ('loop') or of the
+        prefetch worker ('prefetch'). Each source has one writing thread. """
+        self.image_load_seconds[source].observe(seconds)
+
+    def exposition(self):
+        """ Returns all metrics in the Prometheus text format """
+        lines = ['# HELP image_clock_frame_seconds Work time of a frame by display state.',
+                 '# TYPE image_clock_frame_seconds histogram']
+        for state, histogram in self.frame_seconds.items():
+            histogram.write(lines, 'image_clock_frame_seconds', 'state="%s"' % self.state_names[state])
+        lines += ['# HELP image_clock_missed_deadlines_total Frames that took longer than the frame period of their display state.',
+                  '# TYPE image_clock_missed_deadlines_total counter']
+        lines += ['image_clock_missed_deadlines_total{state="%s"} %d' % (self.state_names[state], count)
+                  for state, count in self.missed_deadlines.items()]
+        lines += ['# HELP image_clock_image_load_seconds Time to load and scale an image.',
+                  '# TYPE image_clock_image_load_seconds histogram']
+        for source, histogram in self.image_load_seconds.items():
+            histogram.write(lines, 'image_clock_image_load_seconds', 'source="%s"' % source)
+        for counter in ('hits', 'misses', 'evictions'):
+            lines += ['# HELP image_clock_cache_%s_total Scaled image cache %s.' % (counter, counter),
+                      '# TYPE image_clock_cache_%s_total counter' % counter]
+            lines += ['image_clock_cache_%s_total{cache="%s"} %d' % (counter, name, getattr(source, counter))
+                      for name, source in self.cache_sources.items() if hasattr(source, counter)]
+        catalog = self.catalog
+        if catalog:
+            lines += ['# HELP image_clock_catalog_images Cataloged image files.',
+                      '# TYPE image_clock_catalog_images gauge',
+                      'image_clock_catalog_images %d' % catalog['images'],
+                      '# HELP image_clock_catalog_error_files Files that are not valid clock images.',
+                      '# TYPE image_clock_catalog_error_files gauge',
+                      'image_clock_catalog_error_files %d' % catalog['error_files'],
+                      '# HELP image_clock_missing_minutes Minutes of the day without an image.',
+                      '# TYPE image_clock_missing_minutes gauge',
+                      'image_clock_missing_minutes %d' % catalog['missing_minutes'],
+                      '# HELP image_clock_missing_minutes_by_hour Minutes of each hour without an image.',
+                      '# TYPE image_clock_missing_minutes_by_hour gauge']
+            lines += ['image_clock_missing_minutes_by_hour{hour="%s"} %d' % (hour, missing)
+                      for hour, missing in catalog['missing_minutes_by_hour'].items()]
+        resident, peak = memory_bytes()
+        if resident is not None:
+            lines += ['# HELP process_resident_memory_bytes Resident memory size in bytes.',
+                      '# TYPE process_resident_memory_bytes gauge',
+                      'process_resident_memory_bytes %d' % resident]
+        if peak is not None:
+            lines += ['# HELP process_max_resident_memory_bytes Peak resident memory size in bytes.',
+                      '# TYPE process_max_resident_memory_bytes gauge',
+                      'process_max_resident_memory_bytes %d' % peak]
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """ Serves the metrics of server.metrics at /metrics """
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_error(404)
+            return
+        body = self.server.metrics.exposition().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', CONTENT_TYPE)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return str(self.client_address[0]) if self.client_address else 'unix'
+
+    def log_message(self, format, *args):
+        # a scrape every few seconds should not fill the console
+        pass
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """ An HTTP server on a Unix socket """
+    daemon_threads = True
+
+    def server_bind(self):
+        # replace the socket of a previous run
+        if os.path.exists(self.server_address):
+            os.unlink(self.server_address)
+        socketserver.UnixStreamServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+
+class MetricsServer:
+    """
+    Serves the metrics in a daemon thread on address and port, or on the
+    Unix socket socket_path if it is given. Port 0 picks a free port, see
+    the port attribute after start().
+    """
+    def __init__(self, metrics: ClockMetrics, address='127.0.0.1', port=9180, socket_path=''):
+        self.metrics = metrics
+        self.address = address
+        self.port = port
+        self.socket_path = socket_path
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        if self.socket_path:
+            self.httpd = UnixHTTPServer(self.socket_path, MetricsRequestHandler)
+        else:
+            self.httpd = ThreadingHTTPServer((self.address, self.port), MetricsRequestHandler)
+            self.port = self.httpd.server_address[1]
+        self.httpd.metrics = self.metrics
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name='MetricsServer', daemon=True)
+        self.thread.start()
+
+    def shutdown(self):
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        self.httpd = None
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import http.client
+    import tempfile
+    import urllib.request
+
+    class UnixHTTPConnection(http.client.HTTPConnection):
+        def __init__(self, socket_path):
+            http.client.HTTPConnection.__init__(self, 'localhost')
+            self.socket_path = socket_path
+
+        def connect(self):
+            self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.sock.connect(self.socket_path)
+
+    class Counter:
+        hits, misses = 9, 1
+
+    metrics = ClockMetrics({0: 'startup', 4: 'image', 8: 'analog'})
+    for frame in range(100):
+        metrics.record_frame(8, .002 * (frame % 25), 1 / 30)
+    metrics.record_image_load('loop', .3)
+    metrics.cache_sources = {'prefetch': Counter()}
+    metrics.catalog = {'images': 3, 'error_files': 1, 'missing_minutes': 1437,
+                       'missing_minutes_by_hour': {'00': 57}}
+
+    server = MetricsServer(metrics, port=0)
+    server.start()
+    with urllib.request.urlopen('http://127.0.0.1:%d/metrics' % server.port) as response:
+        text = response.read().decode()
+        assert response.headers['Content-Type'] == CONTENT_TYPE
+    server.shutdown()
+    for expected in ('image_clock_frame_seconds_count{state="analog"} 100',
+                     'image_clock_missed_deadlines_total{state="analog"} 32',
+                     'image_clock_image_load_seconds_bucket{source="loop",le="0.5"} 1',
+                     'image_clock_cache_hits_total{cache="prefetch"} 9',
+                     'image_clock_missing_minutes 1437'):
+        assert expected in text.splitlines(), expected
+    print("TCP: served %d lines" % len(text.splitlines()))
+
+    if hasattr(socket, 'AF_UNIX'):
+        socket_path = os.path.join(tempfile.mkdtemp(), 'metrics.sock')
+        server = MetricsServer(metrics, socket_path=socket_path)
+        server.start()
+        connection = UnixHTTPConnection(socket_path)
+        connection.request('GET', '/metrics')
+        response = connection.getresponse()
+        assert response.status == 200
+        assert 'image_clock_catalog_images 3' in response.read().decode().splitlines()
+        connection.request('GET', '/other')
+        response = connection.getresponse()
+        response.read()
+        assert response.status == 404
+        connection.close()
+        server.shutdown()
+        print("Unix socket: served", socket_path)
+    print(metrics.exposition())
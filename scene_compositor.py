@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+
+"""
+A layered scene for the clock screen. Each layer reports the areas where it
+changed, and the compositor draws only those areas again, all layers from the
+bottom up, and returns them for pygame.display.update. A frame of the ticking
+analog clock then updates the area of the second hand instead of the whole
+square, and a new kind of overlay is a new layer.
+
+Layers, bottom up, as used by clock_main.py:
+    FillLayer          the black screen around the clock square
+    AnalogClockLayer   the AnalogTimepiece, when no image is shown
+    ImageLayer         the image of the minute
+    LabelLayer         the time, date and next image labels
+    FrameHUD           the frame timing overlay of frame_hud.py
+
+USE:
+    scene = SceneCompositor(screen, [FillLayer(screen.get_rect()), ...])
+    while running:
+        ... change the layers, which mark their changed areas ...
+        pygame.display.update(scene.compose())
+
+A layer has three methods:
+    dirty_rects()        the Rects of the surface that changed this frame
+    draw(surface, rect)  draws the layer with the clip of the surface set to
+                         rect. Returns the number of blits
+    composited()         the frame was drawn, forget the changes
+Layer implements them for layers that mark their changes with invalidate().
+
+The clip rect keeps every blit inside the dirty area, so a layer may blit its
+whole surface and only the clipped part is copied.
+
+TEST:
+just run this python file. It composites a scene with moving labels and
+compares it with the whole scene drawn from scratch.
+"""
+
+import pygame
+
+
+def merge_rects(rects):
+    """ Returns the rects with every group of overlapping rects replaced by
+    their union. Empty rects are dropped. """
+    merged = []
+    for rect in rects:
+        rect = pygame.Rect(rect)
+        if rect.w <= 0 or rect.h <= 0:
+            continue
+        index = 0
+        while index < len(merged):
+            if merged[index].colliderect(rect):
+                # the union may now overlap rects that were checked before
+                rect.union_ip(merged.pop(index))
+                index = 0
+            else:
+                index += 1
+        merged.append(rect)
+    return merged
+
+
+class Layer:
+    """ A layer that keeps a list of the areas it invalidated """
+    def __init__(self):
+        self.dirty = []
+
+    def invalidate(self, rect):
+        self.dirty.append(pygame.Rect(rect))
+
+    def dirty_rects(self):
+        return self.dirty
+
+    def draw(self, surface: pygame.Surface, rect: pygame.Rect):
+        return 0
+
+    def composited(self):
+        self.dirty = []
+
+
+class FillLayer(Layer):
+    """ A solid color over rect, usually the bottom of the scene """
+    def __init__(self, rect: pygame.Rect, color=(0, 0, 0)):
+        Layer.__init__(self)
+        self.rect = pygame.Rect(rect)
+        self.color = color
+
+    def draw(self, surface, rect):
+        surface.fill(self.color, self.rect)
+        return 1
+
+
+class ImageLayer(Layer):
+    """ An image at the top left of rect, or nothing if the image is None """
+    def __init__(self):
+        Layer.__init__(self)
+        self.image = None
+        self.rect = pygame.Rect(0, 0, 0, 0)
+
+    def set_image(self, image, rect=None):
+        """ Shows an image at rect, or hides the layer with None """
+        self.invalidate(self.rect)
+        self.image = image
+        if rect is not None:
+            self.rect = pygame.Rect(rect)
+        self.invalidate(self.rect)
+
+    def draw(self, surface, rect):
+        if self.image is None:
+            return 0
+        surface.blit(self.image, self.rect)
+        return 1
+
+
+class AnalogClockLayer(Layer):
+    """
+    An AnalogTimepiece. The timepiece tracks its own changes. compute_timepiece
+    is called by the owner of the clock, and blit_changes is not used.
+    """
+    def __init__(self, timepiece):
+        Layer.__init__(self)
+        self.timepiece = timepiece
+        self.active = True
+        self.frame_blits = 0
+        self.last_blits = 0 # blits of the last composited frame
+
+    def set_active(self, active: bool):
+        """ Shows or hides the clock. It is drawn completely when shown. """
+        if active != self.active:
+            self.active = active
+            self.invalidate(self.timepiece.parentdrawRect)
+
+    def dirty_rects(self):
+        if self.active is True:
+            return self.dirty + self.timepiece.dirty_rects()
+        return self.dirty
+
+    def draw(self, surface, rect):
+        if self.active is False:
+            return 0
+        clock_rect = rect.clip(self.timepiece.parentdrawRect)
+        if clock_rect.w <= 0 or clock_rect.h <= 0:
+            return 0
+        self.timepiece.blit_request(clock_rect)
+        self.frame_blits += 3
+        return 3
+
+    def composited(self):
+        Layer.composited(self)
+        self.timepiece.clear_changes()
+        self.last_blits = self.frame_blits
+        self.frame_blits = 0
+
+
+class LabelLayer(Layer):
+    """
+    Rendered labels by name, drawn in the order they were set. A label whose
+    surface alpha changed is marked with touch().
+    """
+    def __init__(self):
+        Layer.__init__(self)
+        self.labels = dict() # name to (Surface, Rect)
+
+    def set_label(self, name: str, surface: pygame.Surface, rect: pygame.Rect):
+        self.remove_label(name)
+        self.labels[name] = (surface, pygame.Rect(rect))
+        self.invalidate(rect)
+
+    def remove_label(self, name: str):
+        label = self.labels.pop(name, None)
+        if label is not None:
+            self.invalidate(label[1])
+
+    def touch(self, name: str):
+        """ The label looks different, for example a new alpha """
+        label = self.labels.get(name)
+        if label is not None:
+            self.invalidate(label[1])
+
+    def draw(self, surface, rect):
+        blits = 0
+        for label_surface, label_rect in self.labels.values():
+            if label_rect.colliderect(rect):
+                surface.blit(label_surface, label_rect)
+                blits += 1
+        return blits
+
+
+class SceneCompositor:
+    """
+    Draws the changed areas of a list of layers, bottom first, to a surface.
+    """
+    def __init__(self, surface: pygame.Surface, layers: list):
+        self.surface = surface
+        self.layers = layers
+        self.invalid = [] # areas to draw again regardless of the layers
+        self.last_blits = 0
+
+    def invalidate(self, rect=None):
+        """ Draws rect, or the whole surface, again in the next frame, for
+        example after the window was exposed. """
+        self.invalid.append(pygame.Rect(rect) if rect is not None else self.surface.get_rect())
+
+    def compose(self):
+        """ Draws the dirty areas of all layers. Returns the merged list of
+        Rects that changed. """
+        rects = list(self.invalid)
+        for layer in self.layers:
+            rects.extend(layer.dirty_rects())
+        surface_rect = self.surface.get_rect()
+        rects = merge_rects(rect.clip(surface_rect) for rect in rects)
+        blits = 0
+        for rect in rects:
+            self.surface.set_clip(rect)
+            for layer in self.layers:
+                blits += layer.draw(self.surface, rect)
+        self.surface.set_clip(None)
+        for layer in self.layers:
+            layer.composited()
+        self.invalid.clear()
+        self.last_blits = blits
+        return rects
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    import os
+    os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+    pygame.init()
+    screen = pygame.display.set_mode((640, 480))
+    square = pygame.Rect(80, 0, 480, 480)
+    pattern = pygame.Surface(square.size)
+    for x in range(0, 480, 16):
+        for y in range(0, 480, 16):
+            pattern.fill(((x * 5) % 256, (y * 3) % 256, 128), (x, y, 16, 16))
+    label = pygame.Surface((100, 40), pygame.SRCALPHA)
+    label.fill((255, 255, 255, 160))
+    image_layer = ImageLayer()
+    label_layer = LabelLayer()
+    scene = SceneCompositor(screen, [FillLayer(screen.get_rect()), image_layer, label_layer])
+    image_layer.set_image(pattern, square)
+    print("first frame:", scene.compose())
+    updated = 0
+    for frame in range(50):
+        label_layer.set_label('moving', label, (frame * 10, frame * 8, 100, 40))
+        label.set_alpha(255 - frame * 5)
+        label_layer.touch('moving')
+        updated += sum(rect.w * rect.h for rect in scene.compose())
+    expected = pygame.Surface(screen.get_size())
+    expected.fill((0, 0, 0))
+    expected.blit(pattern, square)
+    expected.blit(label, label_layer.labels['moving'][1])
+    same = pygame.image.tostring(screen, 'RGB') == pygame.image.tostring(expected, 'RGB')
+    print("matches a full redraw:", same, "- updated %d pixels per frame of %d" % (updated // 50, 640 * 480))
+    pygame.quit()
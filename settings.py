@@ -69,14 +69,34 @@ else:
 # in a file read operation and overwritten.
 # NOTE: need to figure out how the overwriting works.
 config['GENERAL'] = {'FRAME_RATE': '30',
+                     'FADE_FRAME_RATE': '10',
                      'SCREEN_SLEEP_MINUTES': '8'}
 config['ANALOG_CLOCK'] = {'MARGIN':'150',
-                          'STYLE':'DE'}
+                          'STYLE':'DE',
+                          'WARMUP_BUDGET_MS':'8'}
 config['TEXT_OVERLAY'] = {'STYLE':'SIMPLE',
                           'COLOR':'(128,0,0)',
                           'SIZE':'10',
                           'FADE_TIME':'20',
+                          'FADE_CURVE':'linear',
                           'TRANSITION_TIME':'20'}
+config['CATALOG'] = {'INDEX':'True',
+                     'INDEX_PATH':'',
+                     'FOLLOW_SYMLINKS':'True',
+                     'SCAN_THREADS':'4',
+                     'WATCH':'True',
+                     'WATCH_POLL_SECONDS':'10',
+                     'READ_HEADERS':'True',
+                     'MAX_IMAGE_MEGAPIXELS':'100'}
+config['IMAGE_CACHE'] = {'ENABLED':'True',
+                         'PATH':'',
+                         'SIZE_MB':'1024',
+                         'MEMORY_MB':'64'}
+config['IMAGE_LOADER'] = {'DECODER':'auto'}
+config['METRICS'] = {'ENABLED':'False',
+                     'ADDRESS':'127.0.0.1',
+                     'PORT':'9180',
+                     'SOCKET':''}
 
 if 'args' in globals():
     if args.write_new is True and config_file_path != '':
@@ -87,7 +107,7 @@ if 'args' in globals():
 if config_file_path != '':
     # config.read(config_file_path)
     with open(config_file_path, 'r') as configfile:
-        config.read(configfile)
+        config.read_file(configfile)
         # breakpoint()
 else:
     Exception('No config file present to read or write.')
@@ -96,9 +116,29 @@ else:
 #NOTE: consider assigning by copy() if the reference is CPU costly.
 FRAME_RATE = int(config['GENERAL']['FRAME_RATE']) # NOTE as currently written will be overriden by argparse default
 SCREEN_SLEEP_MINUTES = int(config['GENERAL']['SCREEN_SLEEP_MINUTES'])
+FADE_FRAME_RATE = int(config['GENERAL']['FADE_FRAME_RATE']) # loop rate while text fades over an image
 TYPE_COLOR = (128,0,0) # Color of font overlay fading text
 TIME_FONT_PERCENT = int(config['TEXT_OVERLAY']['SIZE']) #height of time font as percent of display size
 FADE_SECONDS = int(config['TEXT_OVERLAY']['FADE_TIME']) # Number of seconds for font fading
+FADE_CURVE = config['TEXT_OVERLAY']['FADE_CURVE'].lower() # linear, ease-in, ease-out or smooth over FADE_TIME
 TRANSITION_TIME = int(config['TEXT_OVERLAY']['TRANSITION_TIME']) # Number of seconds for font fading
 ANALOG_CLOCK_MARGIN = int(config['ANALOG_CLOCK']['MARGIN'])
+ANALOG_WARMUP_BUDGET_MS = int(config['ANALOG_CLOCK']['WARMUP_BUDGET_MS']) # time per frame to render second hand frames before they are shown, may run over by one frame. 0 to render them when shown
+CATALOG_INDEX = config['CATALOG'].getboolean('INDEX') # keep a persistent index of cataloged files
+CATALOG_INDEX_PATH = config['CATALOG']['INDEX_PATH'] # index file location. Blank to store it in the image directory
+CATALOG_FOLLOW_SYMLINKS = config['CATALOG'].getboolean('FOLLOW_SYMLINKS') # descend into symlinked files and directories
+CATALOG_SCAN_THREADS = int(config['CATALOG']['SCAN_THREADS']) # threads listing directories in parallel. 1 to scan serially
+CATALOG_WATCH = config['CATALOG'].getboolean('WATCH') # update the catalog in place when image files change
+CATALOG_WATCH_POLL_SECONDS = int(config['CATALOG']['WATCH_POLL_SECONDS']) # poll interval where inotify is not available
+CATALOG_READ_HEADERS = config['CATALOG'].getboolean('READ_HEADERS') # check image headers while cataloging
+CATALOG_MAX_IMAGE_MEGAPIXELS = int(config['CATALOG']['MAX_IMAGE_MEGAPIXELS']) # larger images are invalid. 0 for no limit
+IMAGE_CACHE = config['IMAGE_CACHE'].getboolean('ENABLED') # keep scaled images on disk
+IMAGE_CACHE_PATH = config['IMAGE_CACHE']['PATH'] # cache directory. Blank for the default next to the image directory
+IMAGE_CACHE_SIZE_MB = int(config['IMAGE_CACHE']['SIZE_MB']) # disk budget of the scaled image cache
+IMAGE_CACHE_MEMORY_MB = int(config['IMAGE_CACHE']['MEMORY_MB']) # memory budget of scaled images. 0 to disable
+IMAGE_DECODER = config['IMAGE_LOADER']['DECODER'].lower() # auto, pillow or pygame. auto uses Pillow for JPEG if installed
+METRICS = config['METRICS'].getboolean('ENABLED') # serve Prometheus metrics at /metrics
+METRICS_ADDRESS = config['METRICS']['ADDRESS'] # listen address. Keep it on localhost
+METRICS_PORT = int(config['METRICS']['PORT'])
+METRICS_SOCKET = config['METRICS']['SOCKET'] # Unix socket path to listen on instead of the address and port
 
@@ -24,15 +24,136 @@ A set of object definitions to deal with fading text in Pygame.  The
 text_overlays script is in progress.  Not fully implemented yet.
 
 USE:
+FadeText fades a label that is rendered once, for the fading time and date
+of clock_main.py:
+    label = FadeText(font.render(text, True, color), start_alpha=240)
+    while label.alpha > 0:
+        label.update()
+        screen.blit(label.surface, rect)
+The opacity is looked up in a ramp table of the fade curve and applied as the
+surface alpha, so a frame costs one table lookup and one blit.
+
+An OverlayCompositor draws TextOverlay objects and restores only the
+background under them on the next frame:
+    compositor = OverlayCompositor(screen)
+    compositor.add(SimpleFadeText(screen, screen_rect, (20,20), "text", fps, 0, color))
+    while running:
+        pygame.display.update(compositor.draw())
 
 TEST:
+just run this python file. Three overlapping overlays fade over a pattern,
+and the pattern is checked when they have faded out.
 
 TODO:
 * Finish this and document it.
 """
+from functools import lru_cache
+import time
+
 import pygame
 
 import settings as s
+from font_cache import font_cache
+from scene_compositor import merge_rects
+
+# Fade curves from the progress of the fade (0 to 1) to the remaining opacity (1 to 0)
+FADE_CURVES = {'linear': lambda progress: 1 - progress,
+               'ease-in': lambda progress: 1 - progress * progress,        # starts slowly
+               'ease-out': lambda progress: (1 - progress) ** 2,           # starts quickly
+               'smooth': lambda progress: 1 - progress * progress * (3 - 2 * progress)}
+FADE_RAMP_STEPS = 256 # entries of a ramp table over the fade time
+
+
+@lru_cache(maxsize=None)
+def fade_ramp(curve: str, start_alpha: int):
+    """ Returns the alpha of each step of a fade from start_alpha to 0 as a
+    bytes table of FADE_RAMP_STEPS + 1 entries. The last entry is 0. """
+    function = FADE_CURVES[curve]
+    return bytes(min(255, max(0, round(start_alpha * function(step / FADE_RAMP_STEPS))))
+                 for step in range(FADE_RAMP_STEPS)) + bytes(1)
+
+
+class FadeText:
+    """
+    A rendered label that fades out from start_alpha over fade_seconds along
+    a curve of FADE_CURVES. update() sets the surface alpha for the time since
+    the label was created from the clock function. The surface is never
+    redrawn, so it should not be blitted after the alpha reached 0.
+    """
+    def __init__(self, surface: pygame.Surface, start_alpha=255, fade_seconds=None, curve=None,
+                 clock=time.monotonic):
+        self.surface = surface
+        self.fade_seconds = s.FADE_SECONDS if fade_seconds is None else fade_seconds
+        self.ramp = fade_ramp(curve or s.FADE_CURVE, min(start_alpha, 255))
+        self.clock = clock
+        self.fade_start = clock()
+        self.alpha = self.ramp[0] if self.fade_seconds > 0 else 0
+        self.surface.set_alpha(self.alpha)
+
+    def update(self):
+        """ Sets the alpha of the current time. Returns the alpha. """
+        if self.alpha > 0:
+            elapsed = self.clock() - self.fade_start
+            step = int(elapsed * FADE_RAMP_STEPS / self.fade_seconds)
+            alpha = self.ramp[min(max(step, 0), FADE_RAMP_STEPS)]
+            if alpha != self.alpha:
+                self.alpha = alpha
+                self.surface.set_alpha(alpha)
+        return self.alpha
+
+class OverlayCompositor:
+    """
+    Draws TextOverlay objects in the order they were added over a surface and
+    keeps a copy of the background under them, so the next frame restores
+    only those areas instead of the whole surface. Overlapping overlays share
+    one saved area. draw() returns the dirty rects for pygame.display.update.
+
+    If the caller draws the background under the overlays again, for example
+    a new image, it calls rebase() first, so the old background is not
+    restored over the new one.
+    """
+    def __init__(self, parentdrawSurface: pygame.Surface):
+        self.parentdrawSurface = parentdrawSurface
+        self.overlays = []
+        # (Rect, Surface) of the background under the overlays of the last draw
+        self.saved_backgrounds = []
+
+    def add(self, overlay):
+        self.overlays.append(overlay)
+
+    def remove(self, overlay):
+        """ Removes an overlay. Its area is restored by the next draw. """
+        self.overlays.remove(overlay)
+
+    def rebase(self):
+        """ Forgets the saved backgrounds without restoring them, because the
+        background was drawn again. """
+        self.saved_backgrounds.clear()
+
+    def restore(self):
+        """ Blits the saved backgrounds back. Returns their rects. """
+        restored = []
+        for rect, background in self.saved_backgrounds:
+            self.parentdrawSurface.blit(background, rect)
+            restored.append(rect)
+        self.saved_backgrounds.clear()
+        return restored
+
+    def draw(self):
+        """ Computes and draws one frame of all overlays. Returns the merged
+        rects that changed on the surface. """
+        dirty_rects = self.restore()
+        for overlay in self.overlays:
+            overlay.compute()
+        visible = [overlay for overlay in self.overlays if overlay.is_visible()]
+        surface_rect = self.parentdrawSurface.get_rect()
+        overlay_rects = merge_rects(overlay.get_rect().clip(surface_rect) for overlay in visible)
+        for rect in overlay_rects:
+            self.saved_backgrounds.append((rect, self.parentdrawSurface.subsurface(rect).copy()))
+        for overlay in visible:
+            overlay.blit()
+        return merge_rects(dirty_rects + overlay_rects)
+
 
 # General Class TextOverlay
 # contains loop control and initial conditions
@@ -55,8 +176,9 @@ class TextOverlay:
         a parent class for specific effects. Methods are designed to be uniform
         accross different child classes and inherit as much common logic and
         funtionality as possible. For processor efficency, methods are designed
-        to blit to a screen surface and not other intermediate surfaces. Copies
-        of background surfaces are preserved in the class to enable this."""
+        to blit to a screen surface and not other intermediate surfaces. The
+        background under the overlays is saved and restored by an
+        OverlayCompositor."""
         # final surface to draw to, usually screen
         self.parentdrawSurface: pygame.Surface = parentdrawSurface
         # the rectangle defining the area of the parent surface that is used for drawing.
@@ -72,10 +194,9 @@ class TextOverlay:
         self.sequence: int = sequence
         # counter for fading effects. Starts at a high point and decreases to zero normally.
         self.counter: int = self.fps * s.TRANSITION_TIME
-        # intermediate surface for drawing and rendering calculations
-        # may be redifined with a render operation.
-        self.textSurface: pygame.Surface = pygame.Surface(self.parentdrawRect.size)
-        # loop control variable. Clears surfaces and other conditions on first run.
+        # the rendered text. Rendered by the first compute call.
+        self.textSurface: pygame.Surface = pygame.Surface((0,0))
+        # loop control variable. Renders the text on first run.
         self.first_run: bool = True
         # starting color of text overlay
         self.color: tuple = color
@@ -84,38 +205,29 @@ class TextOverlay:
         will have only minor instructions in the parent class.  The inheriting
         classes will expect to modify this method significantly."""
         ## render the appropriate text in first run.
-
         if self.first_run == True:
-            # breakpoint()
-            test_font = pygame.font.SysFont(None,100)
-            self.textSurface = test_font.render(self.text, 1, self.color) 
-            self.textcopySurface = self.textSurface.copy()
-            self.alphatextSurface = pygame.Surface(self.textSurface.get_size())
-            self.alphatextSurface.fill((255,255,255,255))
-            # a copy of the parent draw surface to use as a base for fading operations
-            self.parentcopySurface: pygame.Surface = self.parentdrawSurface.copy() 
+            test_font = font_cache.get("", 100)
+            self.textSurface = test_font.render(self.text, 1, self.color)
+            self.first_run = False
+    def get_rect(self):
+        """ The Rect of the parentdrawSurface the overlay is drawn to """
+        return pygame.Rect((self.parentdrawRect.x+self.blit_position_x,
+                            self.parentdrawRect.y+self.blit_position_y),
+                           self.textSurface.get_size())
+    def is_visible(self):
+        """ Whether the overlay draws anything this frame """
+        return True
     def blit(self):
-        """Blit the workingSurface to the parentdrawSurface with relative
+        """Blit the textSurface to the parentdrawSurface with relative
         coordinates self.blit_position_x and self.blit_position_y with the parentdrawRect as the coordinate
         orgin. Default is at the origin.
         """
-        # blit the working surface textSurface to the parent draw surface in a relative
-        self.parentdrawSurface.blit(self.textSurface, \
-                                    (self.parentdrawRect.x+self.blit_position_x,\
-                                    self.parentdrawRect.y+self.blit_position_y))
-
-        pass
+        self.parentdrawSurface.blit(self.textSurface, self.get_rect())
     def reset(self):
         """ Resets the class to an initial state. Text will not be re-rendered
         until a computer method is called.  """
         self.counter = self.fps * s.TRANSITION_TIME
         self.first_run = True
-        self.textSurface.fill(0,0,0)
-        self.alphatextSurface.fill((255,255,255,255))
-
-    def rebase(self):
-        """ Reloads the base parentdrawSurface into the copy variable """
-        pass
     def change_text(self, new_text: str):
         """ Change the text without reinitializing the object class.  Causes
         the object to reset. Text will not be rendered until a compute method
@@ -137,24 +249,20 @@ class TextOverlay:
 #         super(SimpleFadeText, self).change_text(new_text)
 
 class SimpleFadeText(TextOverlay):
-    """Class to fade text from opaque to transparent."""
+    """Class to fade text from opaque to transparent. The fade is the surface
+    alpha of the rendered text, counted down over TRANSITION_TIME seconds of
+    frames."""
     def __init__(self, parentdrawSurface, parentdrawRect, blit_position, text, fps, sequence, color):
         TextOverlay.__init__(self,parentdrawSurface,parentdrawRect,blit_position, text, fps, sequence, color)
     def compute(self):
         super(SimpleFadeText, self).compute()
-        self.textSurface =  self.textcopySurface.copy()
-        self.textSurface.blit(self.alphatextSurface,(0,0),self.textSurface.get_rect(),pygame.BLEND_RGBA_MULT)
-        # breakpoint()
-        self.alphatextSurface.fill((255,255,255,self.counter * 255 // s.TRANSITION_TIME // self.fps))
+        self.textSurface.set_alpha(self.counter * 255 // s.TRANSITION_TIME // self.fps)
         if(self.counter > 0):
             self.counter -= 1
+    def is_visible(self):
+        return self.textSurface.get_alpha() > 0
     def blit(self):
         super(SimpleFadeText, self).blit()
-        self.parentdrawSurface.blit(self.parentcopySurface,(0,0))
-        self.parentdrawSurface.blit(self.textSurface, 
-                                    (self.parentdrawRect.x+self.blit_position_x,
-                                    self.parentdrawRect.y+self.blit_position_y),
-                                    self.parentdrawRect, pygame.BLEND_RGBA_MULT)
     def reset(self):
         super(SimpleFadeText, self).reset()
     def change_text(self, new_text):
@@ -184,9 +292,19 @@ def main():
     screen_rect = pygame.Rect(50, 0, 700, 700)
     pygame.event.set_blocked(pygame.MOUSEMOTION)
     done = False
+    # a pattern makes a wrongly restored background visible
+    for x in range(0, 800, 20):
+        for y in range(0, 700, 20):
+            screen.fill(((x * 3) % 256, (y * 5) % 256, 96), (x, y, 20, 20))
+    background = screen.copy()
+    pygame.display.flip()
     text_one =SimpleFadeText(screen, screen_rect, (20,20), "This is text One", FRAME_RATE, 0, (180,180,255,255))
-    text_two =SimpleFadeText(screen, screen_rect, (100,100), "This is text TWO", FRAME_RATE, 0, (128,128,128,255,))
-    text_three =SimpleFadeText(screen, screen_rect, (200,200), "This is text ThreeThreeThree", FRAME_RATE, 0, (255,0,0,255))
+    text_two =SimpleFadeText(screen, screen_rect, (100,60), "This is text TWO", FRAME_RATE, 0, (128,128,128,255,))
+    text_three =SimpleFadeText(screen, screen_rect, (200,110), "This is text ThreeThreeThree", FRAME_RATE, 0, (255,0,0,255))
+    compositor = OverlayCompositor(screen)
+    for text in (text_one, text_two, text_three):
+        compositor.add(text)
+    checked = False
     # variable that is assigned in the loop but should persist between loops.
     global now
     print("\nStarting text overlays test with a frame rate of", FRAME_RATE,
@@ -195,12 +313,13 @@ def main():
 
     while not done:
         now = datetime.now()
-        text_one.compute()
-        text_one.blit()
-        #### insert the ops here
-        # not the most efficient screen drawing but sufficient for these
-        # purposes.
-        pygame.display.flip()
+        # only the areas of the overlays are drawn and updated
+        dirty_rects = compositor.draw()
+        pygame.display.update(dirty_rects)
+        if not dirty_rects and checked is False:
+            checked = True
+            restored = pygame.image.tostring(screen, 'RGB') == pygame.image.tostring(background, 'RGB')
+            print("Overlays faded out. Background restored exactly:", restored)
         clock.tick(FRAME_RATE)
 
         for event in pygame.event.get():
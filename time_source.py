@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+
+# The Image Clock, a python clock that displays artwork to tell the time, and its
+# component and supporting files (analog clock, file parser, and others)
+# Copyright (C) 2021 github user: RustyPyGuy
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+#
+# To contact the author: send a message to RustyPyGuy on Github.
+
+"""
+Time sources for the game loop. The loop reads the time once per frame with
+next_frame() and everything drawn in the frame uses that frame_time, so the
+clock can run on a simulated time to test or benchmark a whole day.
+
+USE:
+    time_source = SystemTimeSource()
+    time_source = SimulatedTimeSource(start, speed=60)        # a minute per second
+    time_source = SimulatedTimeSource(start, step_seconds=60)  # a minute per frame
+    while running:
+        now = time_source.next_frame()
+
+monotonic() is the elapsed time of the source in seconds, for animations like
+the text fade. real_seconds() converts a simulated wait to real time.
+
+TEST:
+just run this python file.
+"""
+
+import time
+from datetime import datetime, timedelta
+
+
+class SystemTimeSource:
+    """ The system clock """
+    simulated = False
+
+    def __init__(self):
+        self.frame_time = datetime.now()
+
+    def now(self):
+        return datetime.now()
+
+    def monotonic(self):
+        return time.monotonic()
+
+    def next_frame(self):
+        """ Reads the time of a new frame and returns it """
+        self.frame_time = self.now()
+        return self.frame_time
+
+    def real_seconds(self, seconds: float):
+        """ Real seconds that pass while seconds of this source pass """
+        return seconds
+
+
+class SimulatedTimeSource:
+    """
+    A clock starting at start. It runs speed times faster than real time, or
+    if step_seconds is set, it advances exactly step_seconds every frame
+    regardless of real time.
+    """
+    simulated = True
+
+    def __init__(self, start: datetime, speed=1.0, step_seconds=0.0):
+        self.start = start
+        self.speed = speed
+        self.step_seconds = step_seconds
+        self.real_start = time.monotonic()
+        self.frames = 0
+        self.frame_time = start
+
+    def monotonic(self):
+        if self.step_seconds > 0:
+            return max(self.frames - 1, 0) * self.step_seconds
+        return (time.monotonic() - self.real_start) * self.speed
+
+    def now(self):
+        return self.start + timedelta(seconds=self.monotonic())
+
+    def next_frame(self):
+        """ Advances to a new frame and returns its time. The first frame is
+        the start time. """
+        self.frames += 1
+        self.frame_time = self.now()
+        return self.frame_time
+
+    def real_seconds(self, seconds: float):
+        """ Real seconds that pass while seconds of this source pass. Nothing
+        waits in real time when stepping. """
+        if self.step_seconds > 0:
+            return 0.0
+        return seconds / self.speed
+
+
+if __name__ == "__main__":
+    """ This is executed when run from the command line """
+    start = datetime(2021, 9, 13, 23, 58)
+    stepping = SimulatedTimeSource(start, step_seconds=60)
+    print("stepping:", [stepping.next_frame().strftime("%H:%M") for frame in range(4)])
+    fast = SimulatedTimeSource(start, speed=120)
+    time.sleep(0.5)
+    print("120x after 0.5 s:", fast.next_frame().strftime("%H:%M:%S"))
+    print("system:", SystemTimeSource().next_frame())